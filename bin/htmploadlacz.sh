@@ -151,12 +151,19 @@ checkStatus ${STAT} "Running preprocess.sh ${CONFIG}"
 # sort the pre-processed file
 # sort by column 7 (allele name)
 # sort by column 6 (allele state)
+# sort by column 4 (mp id)
+# in byte order (LC_ALL=C); makeGenotype checks the file is in this order
 #
-echo "sorting pre-processed file ${HTMP_INPUT_FILE} ..." >> ${LOG}
-date >> ${LOG}
-sort -o ${HTMP_INPUT_FILE} -t"	" -k7,7 -k6,6 ${HTMP_INPUT_FILE}
-STAT=$?
-checkStatus ${STAT} "sorting pre-processed file"
+# PREPROCESS_SORTED_OUTPUT=1 : preprocess has already written it in this order
+#
+if [ "${PREPROCESS_SORTED_OUTPUT}" != "1" ]
+then
+    echo "sorting pre-processed file ${HTMP_INPUT_FILE} ..." >> ${LOG}
+    date >> ${LOG}
+    LC_ALL=C sort -o ${HTMP_INPUT_FILE} -t"	" -k7,7 -k6,6 -k4,4 ${HTMP_INPUT_FILE}
+    STAT=$?
+    checkStatus ${STAT} "sorting pre-processed file"
+fi
 
 #
 # Create Genotypes
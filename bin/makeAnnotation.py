@@ -299,7 +299,7 @@ def readGenotypes():
 
     global genotypeOrderDict
 
-    for line in fpGenotype.readlines():
+    for line in fpGenotype:
 
 #       field 0: Unique Genotype Sequence Number
 #       field 1: Genotype ID
@@ -327,7 +327,7 @@ def getAnnotations():
 
     lineNum = 0
 
-    for line in fpHTMP.readlines():
+    for line in fpHTMP:
 
         error = 0
         lineNum = lineNum + 1
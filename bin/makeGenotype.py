@@ -109,6 +109,7 @@ import db
 import loadlib
 import sourceloadlib
 import alleleloadlib
+import preparelib
 import Set
 
 db.setTrace(True)
@@ -169,11 +170,51 @@ field: %s
 '''
 
 #
-# key = str(markerKey) + str(alleleKey) + str(alleleState) + str(strainKey)  + str(mutantKey)
+# key = (markerKey, alleleKey, alleleState, strainKey, mutantKey)
 # value = genotypeOrder
 #
 genotypeOrderDict = {}
 
+#
+# existing strains, see initialize()
+# key = (strain, colonyID) - one entry for each colony ID in the strain
+#	colony ID note; the 'Not Specified' strain has key 
+#	('Not Specified', None)
+# value = (strain accession id, _Strain_key)
+#
+strainIndexDict = {}
+
+#
+# accession id/cell line -> key, see prefetchKeys()
+# ids that are not found are verified row by row with loadlib/alleleloadlib
+#
+markerKeyDict = {}
+alleleKeyDict = {}
+mutantKeyDict = {}
+
+#
+# marker lookups, see prefetchKeys()
+# key = _Marker_key
+# value = wild type allele accession id (None if the marker has no
+#	wild type allele) / chromosome (None if the marker is not found)
+#
+wildTypeDict = {}
+chromosomeDict = {}
+
+# number of ids per 'in' list when querying for a set of ids
+queryBatchSize = 1000
+
+#
+# existing genotypes created by the htmpload user, see initialize()
+# key = (_Marker_key, _Allele_key_1, allele 2, _MutantCellLine_key_1,
+#	_MutantCellLine_key_2, pair state, _Strain_key)
+#	allele 2 = 'same' if it is allele 1, 'other' if it is a different
+#	allele, None if there is no allele 2
+#	mutant cell line key = None if there is no mutant cell line
+# value = genotype accession id
+#
+genotypeDict = {}
+
 #
 # Purpose: Initialization
 # Returns: 1 if file does not exist or is not readable, else 0
@@ -185,6 +226,7 @@ def initialize():
     global logDiagFile, logCurFile
     global htmpInputFile, htmpDupFile, htmpErrorFile, HTMPFile
     global genotypeFile, createdBy, jnumber
+    global strainIndexDict
 
     logDiagFile = os.getenv('LOG_DIAG')
     logCurFile = os.getenv('LOG_CUR')
@@ -260,9 +302,8 @@ def initialize():
     # colonyID
     #
 
-    db.sql('''
+    results = db.sql('''
         select s._Strain_key, s.strain, a.accID as strainID, regexp_replace(regexp_replace(n.note, '^\s+', ''), '\s+$', '') as colonyID
-        into temporary table strains
         from PRB_Strain s, ACC_Accession a, MGI_Note n
         where s._Strain_key = a._Object_key
         and a._MGIType_key = 10
@@ -280,8 +321,16 @@ def initialize():
         and s._Strain_key = -1
         ''', 'auto')
 
-    db.sql('create index idx1 on strains(strain)', None)
-    db.sql('create index idx2 on strains(colonyID)', None)
+    # the colony ID note may be a '|'-delimited list of colony IDs
+    # more than one strain for the same key - last one wins
+    for r in results:
+        value = (r['strainID'], r['_Strain_key'])
+        if r['colonyID'] is None:
+            strainIndexDict[(r['strain'], None)] = value
+        else:
+            for colonyID in r['colonyID'].split('|'):
+                strainIndexDict[(r['strain'], colonyID.strip())] = value
+
     #
     # grab/save existing genotypes
     #
@@ -296,9 +345,10 @@ def initialize():
     # 6/17 - removed _ModifiedBy_key restriction i.e. curator can modify
     #   but still want to create new genotype if curator created.
 
-    db.sql('''
-        select a.accID, ap.*, t.term, g._Strain_key
-        into temporary table genotypes
+    results = db.sql('''
+        select a.accID, ap._Marker_key, ap._Allele_key_1, ap._Allele_key_2,
+               ap._MutantCellLine_key_1, ap._MutantCellLine_key_2,
+               t.term, g._Strain_key
         from GXD_Genotype g, GXD_AllelePair ap,
              ACC_Accession a, VOC_Term t, MGI_User u1
         where g._Genotype_key = a._Object_key
@@ -311,9 +361,21 @@ def initialize():
         and t._Vocab_key = 39
         and g._CreatedBy_key = u1._User_key
         and u1.login = '%s'
-        ''' % (createdBy), None)
+        ''' % (createdBy), 'auto')
+
+    # more than one genotype for the same key - last one wins
+    for r in results:
+        if r['_Allele_key_2'] is None:
+            allele2 = None
+        elif r['_Allele_key_2'] == r['_Allele_key_1']:
+            allele2 = 'same'
+        else:
+            allele2 = 'other'
 
-    db.sql('create index idx3 on genotypes(_Marker_key)', None)
+        key = (r['_Marker_key'], r['_Allele_key_1'], allele2, \
+                r['_MutantCellLine_key_1'], r['_MutantCellLine_key_2'], \
+                r['term'], r['_Strain_key'])
+        genotypeDict[key] = r['accID']
 
     return rc
 
@@ -435,11 +497,215 @@ def closeFiles():
     return 0
 
 
+#
+# Purpose: Prepare the statements for the lookups that are run many times
+#	with different values
+# Returns: 0
+# Assumes: db.useOneConnection(1)
+# Effects: creates prepared statements
+# Throws: Nothing
+#
+def prepareStatements():
+
+    preparelib.prepare('htmp_mutant_keys', ['text[]'], '''
+        select _CellLine_key, cellLine
+        from ALL_CellLine
+        where cellLine = any($1)
+        and isMutant = 1
+        ''')
+
+    preparelib.prepare('htmp_allele_keys', ['text[]'], '''
+        select accID, _Object_key
+        from ACC_Accession
+        where accID = any($1)
+        and _MGIType_key = 11
+        and _LogicalDB_key = 1
+        and preferred = 1
+        ''')
+
+    preparelib.prepare('htmp_marker_keys', ['text[]'], '''
+        select a.accID, m._Marker_key, m.chromosome
+        from ACC_Accession a, MRK_Marker m
+        where a.accID = any($1)
+        and a._MGIType_key = 2
+        and a._LogicalDB_key = 1
+        and a.preferred = 1
+        and a._Object_key = m._Marker_key
+        ''')
+
+    preparelib.prepare('htmp_wild_types', ['int[]'], '''
+        select wt._Marker_key, awt.accID
+        from ALL_Allele wt, ACC_Accession awt
+        where wt._Marker_key = any($1)
+        and wt.name = 'wild type'
+        and wt._Allele_key = awt._Object_key
+        and awt._MGIType_key = 11
+        and awt._LogicalDB_key = 1
+        and awt.preferred = 1
+        ''')
+
+    preparelib.prepare('htmp_chromosome', ['int'], '''
+        select chromosome 
+        from MRK_Marker 
+        where _Marker_key = $1
+        ''')
+
+    return 0
+
+#
+# Purpose: Prefetch the keys of every marker, allele and mutant cell line
+#	in the HTMP input file, and the wild type allele and chromosome
+#	of every marker
+# Returns: 0
+# Assumes: fpHTMPInput is open, prepareStatements() has been called
+# Effects: sets markerKeyDict, alleleKeyDict, mutantKeyDict, 
+#	wildTypeDict, chromosomeDict; rewinds fpHTMPInput
+# Throws: Nothing
+#
+def prefetchKeys():
+
+    markerIDSet = set()
+    alleleIDSet = set()
+    mutantIDSet = set()
+
+    for line in fpHTMPInput:
+        tokens = line[:-1].split('\t')
+        if len(tokens) < 8:
+            continue
+        if len(tokens[2]) > 0:
+            mutantIDSet.add(tokens[2])
+        if len(tokens[4]) > 0:
+            alleleIDSet.add(tokens[4])
+        if len(tokens[7]) > 0:
+            markerIDSet.add(tokens[7])
+
+    fpHTMPInput.seek(0)
+
+    mutantIDList = sorted(mutantIDSet)
+
+    for i in range(0, len(mutantIDList), queryBatchSize):
+        results = preparelib.execute('htmp_mutant_keys', [mutantIDList[i:i + queryBatchSize]])
+
+        for r in results:
+            mutantKeyDict[r['cellLine']] = r['_CellLine_key']
+
+    alleleIDList = sorted(alleleIDSet)
+
+    for i in range(0, len(alleleIDList), queryBatchSize):
+        results = preparelib.execute('htmp_allele_keys', [alleleIDList[i:i + queryBatchSize]])
+
+        for r in results:
+            alleleKeyDict[r['accID']] = r['_Object_key']
+
+    markerIDList = sorted(markerIDSet)
+
+    for i in range(0, len(markerIDList), queryBatchSize):
+        results = preparelib.execute('htmp_marker_keys', [markerIDList[i:i + queryBatchSize]])
+
+        for r in results:
+            markerKeyDict[r['accID']] = r['_Marker_key']
+            chromosomeDict[r['_Marker_key']] = r['chromosome']
+
+    markerKeyList = sorted(chromosomeDict.keys())
+
+    for i in range(0, len(markerKeyList), queryBatchSize):
+        getWildTypes(markerKeyList[i:i + queryBatchSize])
+
+    return 0
+
+#
+# Purpose: Look up the wild type alleles of a list of markers
+# Returns: 0
+# Assumes: prepareStatements() has been called
+# Effects: adds to wildTypeDict; None for the markers with no wild type
+# Throws: Nothing
+#
+def getWildTypes(markerKeyList):
+
+    for markerKey in markerKeyList:
+        wildTypeDict[markerKey] = None
+
+    results = preparelib.execute('htmp_wild_types', [markerKeyList])
+
+    for r in results:
+        wildTypeDict[r['_Marker_key']] = r['accID']
+
+    return 0
+
+#
+# Purpose: Get the wild type allele of a marker; markers that were not
+#	prefetched are queried once and saved
+# Returns: wild type allele accession id, None if the marker has none
+# Assumes: prepareStatements() has been called
+# Effects: adds to wildTypeDict
+# Throws: Nothing
+#
+def getWildType(markerKey):
+
+    if markerKey not in wildTypeDict:
+        getWildTypes([markerKey])
+
+    return wildTypeDict[markerKey]
+
+#
+# Purpose: Get the chromosome of a marker; markers that were not
+#	prefetched are queried once and saved
+# Returns: chromosome, None if the marker is not found
+# Assumes: prepareStatements() has been called
+# Effects: adds to chromosomeDict
+# Throws: Nothing
+#
+def getChromosome(markerKey):
+
+    if markerKey not in chromosomeDict:
+        chromosomeDict[markerKey] = None
+        for r in preparelib.execute('htmp_chromosome', [markerKey]):
+            chromosomeDict[markerKey] = r['chromosome']
+
+    return chromosomeDict[markerKey]
+
+#
+# Purpose: Write the saved annotations to the HTMPUNIQ file, one line per
+#	genotype order/mpID; the gender is 'Both' if the lines for the
+#	genotype order/mpID had more than one gender
+# Returns: 0
+# Assumes: fpHTMP is open
+# Effects: writes to fpHTMP, empties annotDict
+# Throws: Nothing
+#
+def writeAnnotations(annotDict):
+
+    #### new code HDP-2 US161 support TR11792 ####
+    # iterate through annotDict
+
+    for key in list(annotDict.keys()):
+        order, mpID = key.split('|')
+        line, genderSet = annotDict[key]
+
+        # if multi lines, the only difference is gender
+        # just get the last (or only) line in the list; prepend the order number
+        line = order + '\t' + line
+
+        # if there are multi gender values in the set, update line to 'Both'
+        if len(genderSet) > 1:
+            # Don't bother to look at values. If already 'Both', we're golden
+            # otherwise just update the line to 'Both'
+            line = line.replace('Male', 'Both')
+            line = line.replace('Female', 'Both')
+
+        # now write out the line
+        fpHTMP.write(line)
+
+    annotDict.clear()
+
+    return 0
+
 #
 # Purpose: Read the HTMP file to verify the Genotypes or create new 
 #	     Genotype input file
-# Returns: 0
-# Assumes: Nothing
+# Returns: 0, 1 if the HTMP file is not sorted
+# Assumes: HTMP file is sorted by allele symbol, allele state, MP ID,
+#	in byte order (sort with LC_ALL=C)
 # Effects: Nothing
 # Throws: Nothing
 #
@@ -452,10 +718,14 @@ def getGenotypes():
     # annotations organized by order/mpID
     # 'order' indicates uniq genotype
     # key = order + '|' + mpID
-    # value = list of lines
+    # value = [last line, set of genders]
+    # only the annotations of the current allele symbol/allele state/MP ID
+    # are saved; all lines for an order/mpID have the same allele 
+    # symbol/allele state/MP ID, so they are complete once those change
     annotDict = {}
+    annotBlock = None
 
-    for line in fpHTMPInput.readlines():
+    for line in fpHTMPInput:
 
         if DEBUG:
             print('\nNEW LINE: ', line)
@@ -465,6 +735,19 @@ def getGenotypes():
 
         tokens = line[:-1].split('\t')
 
+        # the file is sorted in byte order (LC_ALL=C), which is the order
+        # of the python strings, so each block must sort after the last one
+        if (tokens[6], tokens[5], tokens[3]) != annotBlock:
+            if annotBlock is not None and (tokens[6], tokens[5], tokens[3]) < annotBlock:
+                logit = errorDisplay % (tokens[6], lineNum, '7', line)
+                logit = logit + 'input file is not sorted by allele symbol, allele state, MP ID'
+                fpLogDiag.write(logit)
+                fpLogCur.write(logit)
+                return 1
+
+            writeAnnotations(annotDict)
+            annotBlock = (tokens[6], tokens[5], tokens[3])
+
         # sc 2/6/2016 - a subtlety:
         # if genotypeID  remains '', the genotype is not in the database
         # if it is assigned an ID from the database, it is still written to
@@ -491,7 +774,9 @@ def getGenotypes():
 
         # marker
 
-        if len(markerID) > 0:
+        if markerID in markerKeyDict:
+            markerKey = markerKeyDict[markerID]
+        elif len(markerID) > 0:
             markerKey = loadlib.verifyMarker(markerID, lineNum, fpLogDiag)
         else:
             markerKey = 0
@@ -507,7 +792,9 @@ def getGenotypes():
 
         # allele
 
-        if len(alleleID) > 0:
+        if alleleID in alleleKeyDict:
+            alleleKey = alleleKeyDict[alleleID]
+        elif len(alleleID) > 0:
             alleleKey = loadlib.verifyObject(alleleID, 11, None, lineNum, fpLogDiag)
         else:
             alleleKey = 0
@@ -523,13 +810,15 @@ def getGenotypes():
 
         # mutant
 
-        if len(mutantID) > 0:
+        if mutantID in mutantKeyDict:
+           mutantKey = mutantKeyDict[mutantID]
+           mutantKey2 = mutantKey
+
+        elif len(mutantID) > 0:
            mutantKey = alleleloadlib.verifyMutnatCellLine(mutantID, lineNum, fpLogDiag)
            mutantKey2 = mutantKey
-           mutantSQL = mutantSQL2 = '='
 
         else:
-            mutantSQL = 'is'
             mutantKey = 'null'
 
         #
@@ -556,13 +845,12 @@ def getGenotypes():
 
         # NS strain does not have colony ID, so don't check
         if strainName == 'Not Specified':
-            results = db.sql(''' select * from strains where strain = '%s' ''' % strainName, 'auto')
+            strainIndexKey = (strainName, None)
         else:
-            results = db.sql(''' select * from strains where strain = '%s' and colonyID like'%%%s%%' ''' % (strainName, colonyID), 'auto')
+            strainIndexKey = (strainName, colonyID)
 
-        for r in results:
-           strainID = r['strainID']
-           strainKey = r['_Strain_key']
+        if strainIndexKey in strainIndexDict:
+            strainID, strainKey = strainIndexDict[strainIndexKey]
 
         if strainKey == 0:
             logit = errorDisplay % (strainName + '|' + colonyID, lineNum, '10', line)
@@ -582,24 +870,10 @@ def getGenotypes():
             # find the wild type allele accession id
             #
 
-            querySQL = '''
-                select awt.accID
-                        from ALL_Allele wt, ACC_Accession awt
-                        where wt._Marker_key = %s
-                        and wt.name = 'wild type'
-                        and wt._Allele_key = awt._Object_key
-                        and awt._MGIType_key = 11
-                        and awt._LogicalDB_key = 1
-                        and awt.preferred = 1
-                ''' % (markerKey)
-
-            if DEBUG:
-                print(querySQL)
-
-            results = db.sql(querySQL, 'auto')
-            for r in results:
+            wildTypeID = getWildType(markerKey)
+            if wildTypeID is not None:
                 # found the wild type, so set it
-                alleleID2 = r['accID']
+                alleleID2 = wildTypeID
                 mutantID2 = ''
 
             if DEBUG:
@@ -624,38 +898,19 @@ def getGenotypes():
         if DEBUG:
             print('\n    Check AlleleState:')
 
+        # genotype mutant cell line key (None = no mutant cell line)
+        if mutantKey == 'null':
+            genotypeMutantKey = None
+        else:
+            genotypeMutantKey = mutantKey
+
         if alleleState == 'Homozygous':
 
             if DEBUG:
                 print('    Homozygous : querying to find genotype')
 
-            querySQL = '''
-                select g.accID
-                        from genotypes g
-                        where g._Marker_key = %s
-                        and g._Allele_key_1 = %s
-                        and g._Allele_key_2 = %s
-                        and g._MutantCellLine_key_1 %s %s
-                        and g._MutantCellLine_key_2 %s %s
-                        and g.term = '%s'
-                        and g._Strain_key = %s
-                ''' % (markerKey, alleleKey, alleleKey, mutantSQL, mutantKey, mutantSQL, mutantKey, alleleState, strainKey)
-
-            if DEBUG:
-                print(querySQL)
-
-            results = db.sql(querySQL, 'auto')
-
-            if len(results) > 1:
-                if DEBUG:
-                    print('    More than one genotype - last one wins')
-                    print('    %s' % results)
-
-            for r in results:
-                genotypeID = r['accID']
-
-            if DEBUG:
-                print('    genotypeID: %s' % genotypeID)
+            genotypeKey = (markerKey, alleleKey, 'same', \
+                genotypeMutantKey, genotypeMutantKey, alleleState, strainKey)
 
         elif alleleState == 'Heterozygous':
 
@@ -668,33 +923,8 @@ def getGenotypes():
             if DEBUG:
                 print('    Heterozygous : querying to find genotype')
 
-            querySQL = '''
-                select g.accID
-                        from genotypes g
-                        where g._Marker_key = %s
-                        and g._Allele_key_1 = %s
-                        and g._Allele_key_2 != %s
-                        and g._MutantCellLine_key_1 %s %s
-                        and g._MutantCellLine_key_2 is null
-                        and g.term = '%s'
-                        and g._Strain_key = %s
-                ''' % (markerKey, alleleKey, alleleKey, mutantSQL, mutantKey, alleleState, strainKey)
-
-            if DEBUG:
-                print(querySQL)
-
-            results = db.sql(querySQL, 'auto')
-
-            if len(results) > 1:
-                if DEBUG:
-                    print('    More than one genotype - last one wins')
-                    print('    %s' % results)
-
-            for r in results:
-                genotypeID = r['accID']
-
-            if DEBUG:
-                print('    genotypeID: %s' % genotypeID)
+            genotypeKey = (markerKey, alleleKey, 'other', \
+                genotypeMutantKey, None, alleleState, strainKey)
 
         elif alleleState in ('Hemizygous', 'Indeterminate'):
 
@@ -706,63 +936,30 @@ def getGenotypes():
 
             if alleleState == 'Hemizygous':
 
-                querySQL = '''
-                    select chromosome 
-                        from MRK_Marker 
-                        where _Marker_key = %s''' % markerKey
-
-                results = db.sql(querySQL, 'auto')
-
-                for r in results:
-
-                    if r['chromosome'] == 'X':
-                        alleleState = 'Hemizygous X-linked'
-                        if DEBUG:
-                            print('    ', alleleState)
-
-                    elif r['chromosome'] == 'Y':
-                        alleleState = 'Hemizygous Y-linked'
-                        if DEBUG:
-                            print('    ', alleleState)
-
-                    else:
-                        logit = errorDisplay % (alleleState, lineNum, '6', line)
-                        logit = logit + 'pair state %s does not match chromosome %s' % (alleleState, r['chromosome'])
-                        if DEBUG:
-                            print('    ', logit)
-
-                        fpLogDiag.write(logit)
-                        fpLogCur.write(logit)
-                        error = 1
-                        break
-
-            querySQL = '''
-                select g.accID
-                        from genotypes g
-                        where g._Marker_key = %s
-                        and g._Allele_key_1 = %s
-                        and g._Allele_key_2 is null
-                        and g._MutantCellLine_key_1 %s %s
-                        and g._MutantCellLine_key_2 is null
-                        and g.term = '%s'
-                        and g._Strain_key = %s
-                ''' % (markerKey, alleleKey, mutantSQL, mutantKey, alleleState, strainKey)
-            
-            if DEBUG:
-                print(querySQL)
+                chromosome = getChromosome(markerKey)
 
-            results = db.sql(querySQL, 'auto')
+                if chromosome == 'X':
+                    alleleState = 'Hemizygous X-linked'
+                    if DEBUG:
+                        print('    ', alleleState)
 
-            if len(results) > 1:
-                if DEBUG:
-                    print('    More than one genotype - last one wins')
-                    print('    %s' % results)
+                elif chromosome == 'Y':
+                    alleleState = 'Hemizygous Y-linked'
+                    if DEBUG:
+                        print('    ', alleleState)
 
-            for r in results:
-                genotypeID = r['accID']
+                elif chromosome is not None:
+                    logit = errorDisplay % (alleleState, lineNum, '6', line)
+                    logit = logit + 'pair state %s does not match chromosome %s' % (alleleState, chromosome)
+                    if DEBUG:
+                        print('    ', logit)
 
-            if DEBUG:
-                print('    genotypeID: %s' % genotypeID)
+                    fpLogDiag.write(logit)
+                    fpLogCur.write(logit)
+                    error = 1
+
+            genotypeKey = (markerKey, alleleKey, None, \
+                genotypeMutantKey, None, alleleState, strainKey)
 
         else:
             logit = errorDisplay % (alleleState, lineNum, '6', line)
@@ -780,6 +977,16 @@ def getGenotypes():
             fpHTMPError.write(line)
             continue
 
+        #
+        # find the existing genotype
+        #
+
+        if genotypeKey in genotypeDict:
+            genotypeID = genotypeDict[genotypeKey]
+
+        if DEBUG:
+            print('    genotypeID: %s' % genotypeID)
+
         #
         # check genotype unique-ness
         #
@@ -796,10 +1003,10 @@ def getGenotypes():
         # set uniqueness
         # isConditional is always 0, so we do not need to specify this value
         #
-        key = str(markerKey) + str(alleleKey) + str(alleleState) + str(strainKey) + str(mutantKey)
+        key = (markerKey, alleleKey, alleleState, strainKey, mutantKey)
 
         if DEBUG:
-            print('    unique key is: %s' % key)
+            print('    unique key is: %s' % (key,))
 
         if key in genotypeOrderDict:
             dupGeno = 1
@@ -813,8 +1020,9 @@ def getGenotypes():
         #### new code HDP-2 US161 support TR11792 ####
         # add line to dictionary by currentMP key for later processing
         if currentMP not in annotDict:
-            annotDict[currentMP] = []
-        annotDict[currentMP].append(line)
+            annotDict[currentMP] = [line, set()]
+        annotDict[currentMP][0] = line
+        annotDict[currentMP][1].add(gender)
 
         if dupGeno:
             fpHTMPDup.write(line)
@@ -842,32 +1050,7 @@ def getGenotypes():
 
         genotypeOrder = genotypeOrder + 1
 
-    #### new code HDP-2 US161 support TR11792 ####
-    # iterate through annotDict
-
-    for key in list(annotDict.keys()):
-        order, mpID = key.split('|')
-        lineList = annotDict[key]
-        genderSet = set([])
-
-        # get the gender for each line and add to the set
-        for line in lineList:
-            tokens = line.split('\t')
-            genderSet.add(tokens[10])
-
-        # if multi lines, the only difference is gender
-        # just get the last (or only) line in the list; prepend the order number
-        line = order + '\t' + line
-
-        # if there are multi gender values in the set, update line to 'Both'
-        if len(genderSet) > 1:
-            # Don't bother to look at values. If already 'Both', we're golden
-            # otherwise just update the line to 'Both'
-            line = line.replace('Male', 'Both')
-            line = line.replace('Female', 'Both')
-
-        # now write out the line
-        fpHTMP.write(line)
+    writeAnnotations(annotDict)
 
     return 0
 
@@ -887,6 +1070,12 @@ if DEBUG:
 if openFiles() != 0:
     sys.exit(1)
 
+if DEBUG:
+    print('prefetch keys')
+
+prepareStatements()
+prefetchKeys()
+
 if DEBUG:
     print('get genotypes')
 
@@ -34,7 +34,8 @@
 #
 # Outputs:
 #
-#       BCP files:
+#       BCP files (STRAIN_COPY=1: the rows are kept in memory and copied
+#	into the database, no files are written):
 #       PRB_Strain.bcp                  master Strain records
 #       PRB_Strain_Marker.bcp           
 #       VOC_Annot.bcp			strain attributes
@@ -48,7 +49,9 @@
 #
 # Assumes:
 #
-#	That no one else is adding records to the database.
+#	The primary keys and MGI ids are reserved up front (reserveKeys),
+#	so other loads may add records at the same time. The ACC_Accession
+#	keys come from acc_accession_seq, which the database must have.
 #
 # History
 #
@@ -61,9 +64,12 @@
 
 import sys
 import os
+import io
+import subprocess
 import db
 import mgi_utils
 import loadlib
+import preparelib
 
 db.setTrace(True)
 
@@ -75,6 +81,8 @@ mode = os.environ['STRAINMODE']
 inputFileName = os.environ['STRAIN_INPUT_FILE']
 logDir = os.environ['LOGDIR']
 outputDir = os.environ['OUTPUTDIR']
+parallelBCP = os.getenv('STRAIN_BCP_PARALLEL') == '1'
+copyMode = os.getenv('STRAIN_COPY') == '1'
 
 DEBUG = 0		# if 0, not in debug mode
 bcpon = 1		# bcp into the database?  default is yes.
@@ -116,6 +124,11 @@ mgiKey = 0              # ACC_AccessionMax.maxNumericPart
 annotKey = 0		# VOC_Annot._Annot_key
 noteKey = 0             # MGI_Note._Note_key
 
+reservedKeys = {}	# table -> iterator over the keys reserved for this load
+lineCount = 0		# number of lines in the input file
+alleleCount = 0		# number of alleles in the input file
+annotCount = 0		# number of strain attributes in the input file
+
 isPrivate = 0
 isGeneticBackground = 0
 
@@ -129,10 +142,13 @@ mgiMutOrigNoteTypeKey = 1038   # MGI_Note._NoteType_key for mutation of origin
 
 qualifierKey = 615427	# nomenclature
 
-strainDict = {}      	# dictionary of types for quick lookup
+strainDict = {}      	# dictionary of existing strains for quick lookup
 strainTypesDict = {}    # dictionary of types for quick lookup
 colonyIdDict = {}	# dictionary of strain keys mapped to note keys
 speciesDict = {}      	# dictionary of species for quick lookup
+alleleDict = {}		# dictionary of allele ID -> (allele key, marker key)
+
+queryBatchSize = 1000	# number of values per lookup of a list of values
 
 cdate = mgi_utils.date('%m/%d/%Y')	# current date
  
@@ -162,6 +178,21 @@ def exit(
     db.useOneConnection(0)
     sys.exit(status)
  
+# Purpose: open a bcp output file
+# Returns: file descriptor; an in-memory buffer if STRAIN_COPY=1
+# Assumes: nothing
+# Effects: creates the file
+# Throws: IOError if the file cannot be opened
+
+def openOutput(
+    fileName	# bcp file name (str.
+    ):
+
+    if copyMode:
+        return io.StringIO()
+
+    return open(fileName, 'w')
+
 # Purpose: process command line options
 # Returns: nothing
 # Assumes: nothing
@@ -199,27 +230,27 @@ def init():
         exit(1, 'Could not open file %s\n' % inputFileName)
 
     try:
-        strainFile = open(strainFileName, 'w')
+        strainFile = openOutput(strainFileName)
     except:
         exit(1, 'Could not open file %s\n' % strainFileName)
 
     try:
-        markerFile = open(markerFileName, 'w')
+        markerFile = openOutput(markerFileName)
     except:
         exit(1, 'Could not open file %s\n' % markerFileName)
 
     try:
-        accFile = open(accFileName, 'w')
+        accFile = openOutput(accFileName)
     except:
         exit(1, 'Could not open file %s\n' % accFileName)
 
     try:
-        noteFile = open(noteFileName, 'w')
+        noteFile = openOutput(noteFileName)
     except:
         exit(1, 'Could not open file %s\n' % noteFileName)
 
     try:
-        annotFile = open(annotFileName, 'w')
+        annotFile = openOutput(annotFileName)
     except:
         exit(1, 'Could not open file %s\n' % annotFileName)
 
@@ -229,8 +260,37 @@ def init():
 
     errorFile.write('Start Date/Time: %s\n\n' % (mgi_utils.date()))
 
+    prepareStatements()
+
     return
 
+# Purpose: prepare the statements for the lookups that are run for 
+#	every input line
+# Returns: nothing
+# Assumes: db.useOneConnection(1)
+# Effects: creates prepared statements
+# Throws: nothing
+
+def prepareStatements():
+
+    preparelib.prepare('strain_list', ['text[]'], '''
+        select _Strain_key, strain from PRB_Strain where strain = any($1)
+        ''')
+
+    preparelib.prepare('allele_list', ['text[]'], '''
+        select a.accID, a._Object_key as _Allele_key, aa._Marker_key
+        from ACC_Accession a, ALL_Allele aa
+        where a.accID = any($1)
+        and a._MGIType_key = %s
+        and a._LogicalDB_key = 1
+        and a.preferred = 1
+        and a._Object_key = aa._Allele_key
+        ''' % (alleleTypeKey))
+
+    preparelib.prepare('allele_marker', ['int'], '''
+        select _Marker_key from ALL_Allele where _Allele_key = $1
+        ''')
+
 # Purpose: verify processing mode
 # Returns: nothing
 # Assumes: nothing
@@ -334,12 +394,58 @@ def checkColonyNote(strainKey):
 
     return 0
         
+# Purpose:  look up everything in the input file that is needed from
+#	the database, with one query per list of values instead of
+#	queries for each line
+# Returns:  nothing
+# Assumes:  inputFile is open
+# Effects:  adds the strains in the input file that exist in the
+#	database to the Strain dictionary, and the alleles with their
+#	markers to the Allele dictionary; counts the lines, alleles and
+#	strain attributes; rewinds inputFile
+# Throws:  nothing
+
+def preloadInput():
+
+    global strainDict, alleleDict, lineCount, alleleCount, annotCount
+
+    strainSet = set()
+    alleleSet = set()
+
+    for line in inputFile:
+        tokens = line[:-1].split('\t')
+        strainSet.add(tokens[0])
+        if len(tokens) > 1:
+            alleleSet.update(tokens[1].split('|'))
+            alleleCount = alleleCount + len(tokens[1].split('|'))
+        if len(tokens) > 8:
+            annotCount = annotCount + len(tokens[8].split('|'))
+        lineCount = lineCount + 1
+
+    inputFile.seek(0)
+
+    strainList = sorted(strainSet)
+
+    for i in range(0, len(strainList), queryBatchSize):
+        results = preparelib.execute('strain_list', [strainList[i:i + queryBatchSize]])
+
+        for r in results:
+            strainDict[r['strain']] = r['_Strain_key']
+
+    alleleList = sorted(alleleSet)
+
+    for i in range(0, len(alleleList), queryBatchSize):
+        results = preparelib.execute('allele_list', [alleleList[i:i + queryBatchSize]])
+
+        for r in results:
+            alleleDict[r['accID']] = (r['_Allele_key'], r['_Marker_key'])
+
 # Purpose:  verify Strain
 # Returns:  Strain Key if Strain is valid, else 0
-# Assumes:  nothing
-# Effects:  verifies that the Strain exists either in the Strain dictionary or the database
-#	writes to the error file if the Strain is invalid
-#	adds the Strain and key to the Strain dictionary if the Strain Type is valid
+# Assumes:  preloadInput() has added the existing strains to the
+#	Strain dictionary
+# Effects:  verifies that the Strain exists in the Strain dictionary
+#	writes to the error file if the Strain exists
 # Throws:  nothing
 
 def verifyStrain(
@@ -347,15 +453,6 @@ def verifyStrain(
     lineNum	# line number (integer)
     ):
 
-    global strainDict
-
-    results = db.sql('''
-        select _Strain_key, strain from PRB_Strain where strain = '%s'
-        ''' % (strain), 'auto')
-
-    for r in results:
-        strainDict[r['strain']] = r['_Strain_key']
-
     if strain in strainDict:
             strainExistKey = strainDict[strain]
             errorFile.write('Strain Already Exists (%d) %s\n' % (lineNum, strain))
@@ -365,42 +462,119 @@ def verifyStrain(
 
     return strainExistKey
 
-# Purpose:  sets global primary key variables
-# Returns:  nothing
+# Purpose:  reserves a block of keys from a sequence
+# Returns:  list of keys
 # Assumes:  nothing
-# Effects:  sets global primary key variables
+# Effects:  advances the sequence by count; the keys cannot be given to
+#	anyone else, so concurrent loads do not collide. The keys are in
+#	order but have gaps if another load takes keys at the same time.
 # Throws:   nothing
 
-def setPrimaryKeys():
-
-    global strainKey, strainmarkerKey, accKey, mgiKey, annotKey, noteKey
+def reserveSequence(
+    sequence,	# sequence name (str.
+    count	# number of keys (integer)
+    ):
 
-    results = db.sql(''' select nextval('prb_strain_seq') as maxKey ''', 'auto')
-    strainKey = results[0]['maxKey']
+    results = db.sql(''' select nextval('%s') as key from generate_series(1, %d) ''' \
+        % (sequence, count), 'auto')
 
-    results = db.sql(''' select nextval('prb_strain_marker_seq') as maxKey ''', 'auto')
-    strainmarkerKey = results[0]['maxKey']
+    return [r['key'] for r in results]
 
-    results = db.sql('select max(_Accession_key) + 1 as maxKey from ACC_Accession', 'auto')
-    accKey = results[0]['maxKey']
+# Purpose:  reserves the primary keys and MGI ids for this load, based on
+#	the counts from preloadInput(); replaces reading a starting key and
+#	incrementing it
+# Returns:  nothing
+# Assumes:  preloadInput() has been called
+# Effects:  sets reservedKeys and mgiKey
+#	advances the sequences; advances ACC_AccessionMax unless in
+#	preview mode (not committed)
+#	exits if acc_accession_seq does not exist
+# Throws:   nothing
 
-    results = db.sql('''select maxNumericPart + 1 as maxKey from ACC_AccessionMax where prefixPart = '%s' ''' % (mgiPrefix), 'auto')
+def reserveKeys():
+
+    global mgiKey
+
+    reservedKeys[strainTable] = iter(reserveSequence('prb_strain_seq', lineCount))
+    reservedKeys[markerTable] = iter(reserveSequence('prb_strain_marker_seq', alleleCount))
+    reservedKeys[annotTable] = iter(reserveSequence('voc_annot_seq', annotCount))
+    # a new strain line has at most 2 notes (colony id, mutant cell line);
+    # an existing strain line has at most 1
+    reservedKeys[noteTable] = iter(reserveSequence('mgi_note_seq', 2 * lineCount))
+
+    # ACC_Accession keys come from acc_accession_seq; without it the keys 
+    # would have to come from max(_Accession_key), which concurrent loads 
+    # can read at the same time
+    results = db.sql(''' select to_regclass('acc_accession_seq') is not null as hasSeq ''', 'auto')
+    if not results[0]['hasSeq']:
+        exit(1, 'Sequence acc_accession_seq does not exist\n')
+    reservedKeys[accTable] = iter(reserveSequence('acc_accession_seq', lineCount))
+
+    # MGI ids: the update locks the ACC_AccessionMax row, so the block is
+    # contiguous. It is committed by bcpFiles()/copyFiles() just before the
+    # load, as ACC_setMax was; an exit before then (ex. Invalid Line) rolls
+    # it back, so no MGI ids are used up
+    if DEBUG:
+        results = db.sql('''select maxNumericPart + 1 as maxKey from ACC_AccessionMax where prefixPart = '%s' ''' % (mgiPrefix), 'auto')
+    else:
+        results = db.sql('''update ACC_AccessionMax set maxNumericPart = maxNumericPart + %d where prefixPart = '%s' returning maxNumericPart - %d + 1 as maxKey ''' \
+            % (lineCount, mgiPrefix, lineCount), 'auto')
     mgiKey = results[0]['maxKey']
 
-    results = db.sql(''' select nextval('voc_annot_seq') as maxKey ''', 'auto')
-    annotKey = results[0]['maxKey']
+# Purpose:  returns the next reserved key for a table
+# Returns:  key (integer)
+# Assumes:  reserveKeys() has been called
+# Effects:  nothing
+# Throws:   StopIteration if the reserved keys have all been used
+
+def nextKey(
+    table	# table name (str.
+    ):
 
-    results = db.sql(''' select nextval('mgi_note_seq') as maxKey ''', 'auto')
-    noteKey = results[0]['maxKey']
+    return next(reservedKeys[table])
+
+# Purpose:  runs bcp commands at the same time and waits for them
+# Returns:  number of commands that failed
+# Assumes:  the tables loaded by the commands do not depend on each other
+# Effects:  BCPs the data into the database
+#	writes the commands and any failures to the diagnostic file
+# Throws:   nothing
+
+def runBCP(
+    bcpCmdList	# list of bcp commands (str.
+    ):
+
+    processList = []
+
+    for bcpCmd in bcpCmdList:
+        diagFile.write('%s\n' % bcpCmd)
+        diagFile.flush()
+        processList.append((bcpCmd, subprocess.Popen(bcpCmd, shell=True)))
+
+    failed = 0
+
+    for bcpCmd, process in processList:
+        status = process.wait()
+        if status != 0:
+            diagFile.write('bcp failed (exit status %d): %s\n' % (status, bcpCmd))
+            errorFile.write('bcp failed (exit status %d): %s\n' % (status, bcpCmd))
+            failed = failed + 1
+
+    return failed
 
 # Purpose:  BCPs the data into the database
 # Returns:  nothing
 # Assumes:  nothing
 # Effects:  BCPs the data into the database
+#	exits if a bcp command fails
 # Throws:   nothing
 
 def bcpFiles():
 
+    if copyMode:
+        copyFiles()
+        return
+
     strainFile.close()
     markerFile.close()
     accFile.close()
@@ -410,6 +584,7 @@ def bcpFiles():
     if DEBUG or not bcpon:
         return
 
+    # commits the ACC_AccessionMax update from reserveKeys()
     db.commit()
 
     bcpCommand = os.environ['PG_DBUTILS'] + '/bin/bcpin.csh'
@@ -425,23 +600,75 @@ def bcpFiles():
     bcp5 = '%s %s %s %s %s %s "\|" "\\n" mgd' % \
         (bcpCommand, db.get_sqlServer(), db.get_sqlDatabase(), noteTable, outputDir, noteTableBCP)
 
-    for bcpCmd in [bcp1, bcp2, bcp3, bcp4, bcp5]:
-        diagFile.write('%s\n' % bcpCmd)
-        os.system(bcpCmd)
+    # PRB_Strain_Marker references PRB_Strain, so PRB_Strain is loaded
+    # first, and the dependent loads are not started if it fails; the
+    # other tables do not depend on each other
+    if runBCP([bcp1]) > 0:
+        exit(1, 'bcp of %s failed, see %s\n' % (strainTable, diagFileName))
 
-    # update prb_strain auto-sequence
-    db.sql(''' select setval('prb_strain_seq', (select max(_Strain_key) from PRB_Strain)) ''', None)
-    db.commit()
-    # update prb_strain_marker_seq auto-sequence
-    db.sql(''' select setval('prb_strain_marker_seq', (select max(_StrainMarker_key) from PRB_Strain_Marker)) ''', None)
-    db.commit()
-    # update voc_annot_seq auto-sequence
-    db.sql(''' select setval('voc_annot_seq', (select max(_Annot_key) from VOC_Annot)) ''', None)
-    db.commit()
-    # update mgi_note_seq auto-sequence
-    db.sql(''' select setval('mgi_note_seq', (select max(_Note_key) from MGI_Note)) ''', None)
+    if parallelBCP:
+        failed = runBCP([bcp2, bcp3, bcp4, bcp5])
+    else:
+        failed = 0
+        for bcpCmd in [bcp2, bcp3, bcp4, bcp5]:
+            failed = failed + runBCP([bcpCmd])
+
+    # the keys were reserved from the sequences by reserveKeys(), so the
+    # sequences are already past them
+
+    if failed > 0:
+        exit(1, '%d bcp command(s) failed, see %s\n' % (failed, diagFileName))
+
+    return
+
+# Purpose:  copies the in-memory bcp rows into the database in one
+#	transaction
+# Returns:  nothing
+# Assumes:  STRAIN_COPY=1
+# Effects:  copies the data into the database
+#	exits if the copy fails; nothing is loaded
+# Throws:   nothing
+
+def copyFiles():
+
+    if DEBUG or not bcpon:
+        return
+
+    # db does not make its connection available, so the copy uses a
+    # connection of its own, with the same server/database/user
+    import psycopg2
+
+    # commits the ACC_AccessionMax update from reserveKeys()
     db.commit()
 
+    password = open(passwordFileName, 'r').readline().strip()
+    connection = psycopg2.connect(host = db.get_sqlServer(), 
+        database = db.get_sqlDatabase(), user = user, password = password)
+
+    # PRB_Strain first: PRB_Strain_Marker references it
+    copyList = [(strainTable, strainFile), (markerTable, markerFile), 
+                (accTable, accFile), (annotTable, annotFile), 
+                (noteTable, noteFile)]
+
+    try:
+        cursor = connection.cursor()
+
+        for table, buffer in copyList:
+            copyCmd = "copy %s from stdin with delimiter as '|' null as ''" % (table)
+            diagFile.write('%s (%d bytes)\n' % (copyCmd, buffer.tell()))
+            buffer.seek(0)
+            cursor.copy_expert(copyCmd, buffer)
+
+        connection.commit()
+
+    except psycopg2.Error as e:
+        connection.rollback()
+        connection.close()
+        errorFile.write('copy failed: %s\n' % (e))
+        exit(1, 'copy failed: %s\n' % (e))
+
+    connection.close()
+
     return
 
 # Purpose:  create note
@@ -453,12 +680,12 @@ def bcpFiles():
 def createNote(strainKey, note, noteTypeKey, createdByKey):
     global noteKey
 
+    noteKey = nextKey(noteTable)
+
     noteFile.write('%s|%s|%s|%s|%s|%s|%s|%s|%s\n' \
         % (noteKey, strainKey, mgiNoteObjectKey, noteTypeKey, note, \
            createdByKey, createdByKey, cdate, cdate))
 
-    noteKey = noteKey + 1
-
 # Purpose:  processes data
 # Returns:  nothing
 # Assumes:  nothing
@@ -472,7 +699,7 @@ def processFile():
     lineNum = 0
     # For each line in the input file
 
-    for line in inputFile.readlines():
+    for line in inputFile:
 
         lineNum = lineNum + 1
         #print line
@@ -517,6 +744,8 @@ def processFile():
             continue
 
         # if no errors, process
+        strainKey = nextKey(strainTable)
+
         strainFile.write('%d|%s|%s|%s|%s|%s|%s|%s|%s|%s|%s\n' \
             % (strainKey, speciesKey, strainTypeKey, name, isStandard, 
                 isPrivate, isGeneticBackground, createdByKey, createdByKey, 
@@ -526,22 +755,27 @@ def processFile():
         allAlleles = alleleIDs.split('|')
 
         for a in allAlleles:
-                alleleKey = loadlib.verifyObject(a, alleleTypeKey, None, lineNum, errorFile)
-                #print 'makeStrains.py allele: %s marker key: %s' % (a, alleleKey)
-                results = db.sql('select _Marker_key from ALL_Allele where _Allele_key = %s' % (alleleKey),  'auto')
-                markerKey = results[0]['_Marker_key']
-
+                # alleles not found by preloadInput() are verified here,
+                # which reports the error
+                if a in alleleDict:
+                    alleleKey, markerKey = alleleDict[a]
+                else:
+                    alleleKey = loadlib.verifyObject(a, alleleTypeKey, None, lineNum, errorFile)
+                    #print 'makeStrains.py allele: %s marker key: %s' % (a, alleleKey)
+                    results = preparelib.execute('allele_marker', [alleleKey])
+                    markerKey = results[0]['_Marker_key']
+
+                strainmarkerKey = nextKey(markerTable)
                 markerFile.write('%s|%s|%s|%s|%s|%s|%s|%s|%s\n' \
                     % (strainmarkerKey, strainKey, markerKey, alleleKey, 
                         qualifierKey, createdByKey, createdByKey, cdate, cdate))
-                strainmarkerKey = strainmarkerKey + 1
 
         # MGI Accession ID for the strain
         if isStandard == '1':
+            accKey = nextKey(accTable)
             accFile.write('%d|%s%d|%s|%s|1|%d|%d|0|1|%s|%s|%s|%s\n' \
             % (accKey, mgiPrefix, mgiKey, mgiPrefix, mgiKey, strainKey, mgiTypeKey, 
                createdByKey, createdByKey, cdate, cdate))
-            accKey = accKey + 1
 
         # storing data in MGI_Note
         # Colony ID Note
@@ -573,21 +807,15 @@ def processFile():
             if annotTermKey == 0:
                 continue
 
+            annotKey = nextKey(annotTable)
             annotFile.write('%s|%s|%s|%s|%s|%s|%s\n' \
               % (annotKey, annotTypeKey, strainKey, annotTermKey, annotQualifierKey, cdate, cdate))
-            annotKey = annotKey + 1
 
         mgiKey = mgiKey + 1
-        strainKey = strainKey + 1
 
-    #	end of "for line in inputFile.readlines():"
+    #	end of "for line in inputFile:"
 
-    #
-    # Update the AccessionMax value
-    #
-
-    if not DEBUG:
-        db.sql('select * from ACC_setMax (%d)' % (lineNum), None)
+    # the AccessionMax value was updated by reserveKeys()
 
 
 #
@@ -600,8 +828,11 @@ init()
 print('verifyMode : %s' % (mgi_utils.date()))
 verifyMode()
 
-print('set primary keys : %s' % (mgi_utils.date()))
-setPrimaryKeys()
+print('preload input : %s' % (mgi_utils.date()))
+preloadInput()
+
+print('reserve primary keys : %s' % (mgi_utils.date()))
+reserveKeys()
 
 print('prcoess files : %s' % (mgi_utils.date()))
 processFile()
@@ -0,0 +1,112 @@
+#
+# Program: preparelib.py
+#
+# Purpose:
+#
+#	Prepared statements on top of db.sql, for lookups that the
+#	htmpload scripts run many times with different values.
+#
+#	prepare() creates a server-side prepared statement; the statement
+#	is parsed and planned once. execute() runs it with a list of values.
+#	The values are quoted here, so values that contain an apostrophe
+#	(strain names, for example) need no special handling by the caller.
+#
+#	A prepared statement belongs to the database connection, so the
+#	caller must be using one connection (db.useOneConnection(1)).
+#
+# Usage:
+#
+#	import preparelib
+#
+#	preparelib.prepare('strain_lookup', ['text'],
+#		'select _Strain_key from PRB_Strain where strain = $1')
+#	results = preparelib.execute('strain_lookup', [strain])
+#
+#	'in' lists are passed as one array value:
+#
+#	preparelib.prepare('strain_list', ['text[]'],
+#		'select _Strain_key, strain from PRB_Strain where strain = any($1)')
+#	results = preparelib.execute('strain_list', [strainList])
+#
+
+import db
+
+# statements prepared on the current connection
+# key = statement name
+# value = sql
+preparedDict = {}
+
+# Purpose:  quote a value for use as a statement parameter
+# Returns:  sql literal (str.
+# Assumes:  standard_conforming_strings is on (the postgres default), so
+#	only the apostrophe needs escaping
+# Effects:  nothing
+# Throws:   nothing
+
+def quote(
+    value	# None, int, float, str. or a list/tuple/set of these
+    ):
+
+    if value is None:
+        return 'null'
+
+    if isinstance(value, (int, float)):
+        return str(value)
+
+    if isinstance(value, (list, tuple, set)):
+        if len(value) == 0:
+            return "'{}'"
+        return 'array[%s]' % (','.join([quote(v) for v in value]))
+
+    return "'%s'" % (str(value).replace("'", "''"))
+
+# Purpose:  create a prepared statement on the current connection
+# Returns:  nothing
+# Assumes:  db.useOneConnection(1)
+# Effects:  prepares the statement, unless a statement with this name
+#	has already been prepared
+# Throws:   nothing
+
+def prepare(
+    name,	# statement name (str.
+    argTypes,	# list of the parameter types, ex. ['int', 'text']
+    sql		# statement, with parameters $1, $2, ...
+    ):
+
+    if name in preparedDict:
+        return
+
+    if len(argTypes) > 0:
+        db.sql('prepare %s (%s) as %s' % (name, ', '.join(argTypes), sql), None)
+    else:
+        db.sql('prepare %s as %s' % (name, sql), None)
+
+    preparedDict[name] = sql
+
+# Purpose:  execute a prepared statement
+# Returns:  results of db.sql
+# Assumes:  prepare() has been called for the statement
+# Effects:  executes the statement
+# Throws:   nothing
+
+def execute(
+    name,		# statement name (str.
+    args = [],		# parameter values, in order
+    returnAs = 'auto'	# db.sql return type
+    ):
+
+    if len(args) > 0:
+        return db.sql('execute %s (%s)' % (name, ', '.join([quote(a) for a in args])), returnAs)
+
+    return db.sql('execute %s' % (name), returnAs)
+
+# Purpose:  forget the prepared statements; call when the connection
+#	they were prepared on is closed
+# Returns:  nothing
+# Assumes:  nothing
+# Effects:  empties preparedDict
+# Throws:   nothing
+
+def reset():
+
+    preparedDict.clear()
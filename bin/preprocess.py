@@ -89,8 +89,11 @@
 #	2) open input/output files
 #	3) check for provider
 #	4) parse input files using appropriate parsing function to
-#	  create intermediate file
+#	  create intermediate file (PREPROCESS_PIPELINE: the parsed rows
+#	  are passed directly to step 5)
 #	5) interate over intermediate file to create HTMP Load format file 
+#	  (PREPROCESS_SORTED_OUTPUT: written in allele symbol/allele 
+#	  state/MP ID order, so htmpload.sh does not need to sort it)
 #	6) close input/output files
 #
 #  Notes: 
@@ -122,7 +125,12 @@
 
 import sys 
 import os
+import re
 import json
+import heapq
+import pickle
+import collections
+import multiprocessing
 import string
 import Set
 import db
@@ -145,6 +153,63 @@ createdBy = 'htmpload'
 # htmp file constants
 evidenceCode = 'EXP'
 
+# json input settings
+# 1 = read the docs one at a time (PREPROCESS_JSON_STREAM)
+jsonStream = 0
+
+# number of characters read from the json file at a time when streaming
+jsonChunkSize = 1048576
+jsonDecoder = json.JSONDecoder()
+jsonWhiteSpace = re.compile(r'[ \t\n\r]*')
+jsonStructure = re.compile(r'["{}\[\]]')
+jsonString = re.compile(r'"(?:[^"\\]|\\.)*"')
+# chars that can continue a number; a number followed by one of these in
+# the buffer may have been cut off by the end of a chunk ('12.' + '5')
+jsonNumberChars = '0123456789.eE+-'
+
+# maximum number of distinct intermediate rows held in memory before
+# they are spilled to a sorted run file (PREPROCESS_DEDUP_MAX_LINES)
+# 0 = no limit
+dedupMaxLines = 0
+
+# 1 = parsed rows are validated directly, without the intermediate
+#	file round trip (PREPROCESS_PIPELINE)
+pipeline = 0
+
+# 1 = write the intermediate file in pipeline mode, for debugging
+#	(PREPROCESS_KEEP_INT)
+keepIntFile = 0
+
+# distinct parsed rows for createHTMPFile, in pipeline mode
+parsedRows = None
+
+# 1 = write the HTMP file sorted by allele symbol, allele state and
+#	MP ID (PREPROCESS_SORTED_OUTPUT)
+sortedOutput = 0
+
+# snapshot of the database lookups (PREPROCESS_SNAPSHOT_FILE), reused 
+# while the tables they are built from are unchanged; None = no snapshot
+snapshotFile = None
+
+# number of database connections used to run the lookup queries at the
+# same time (PREPROCESS_DB_WORKERS); 1 = run them one after the other
+lookupWorkers = 1
+
+# number of worker processes for the per-row checks in createHTMPFile
+# and the number of rows sent to a worker at a time
+# (PREPROCESS_WORKERS, PREPROCESS_WORKER_CHUNK); 1 = no workers
+validateWorkers = 1
+validateChunkSize = 1000
+
+# in a worker process, logIt arguments are saved here so the parent
+# can write them in input order
+deferredLogList = None
+
+# distinct field values seen while parsing mapped to themselves
+# repeated values (phenotyping center, zygosity, sex, strain, etc.)
+# share one str object, so memory scales with distinct values not rows
+fieldValueDict = {}
+
 # Input 
 inputFile = None
 inputFileInt = None
@@ -186,7 +251,7 @@ errMsg: %s
 errorDict = {}
 
 # GENTAR colony id mapped to GENTAR attributes
-# {colonyId:'productionCtr|mutantID|markerID', ...}
+# {colonyId:(productionCtr, mutantID, markerID), ...}
 colonyToMCLDict = {}
 
 # colony ID to strain Name from the database
@@ -194,13 +259,13 @@ colonyToStrainNameDict = {}
 
 # strain name mapped to colony id; colony id can be empty
 strainNameToColonyIdDict = {}
-multiStrainNameList = []
+multiStrainNameSet = set([])
 
 # strain name mapped to genotype in the database
 strainNameToGenotypeDict = {}
 
 # private strain names so we can report when we find one
-privateStrainList = []
+privateStrainSet = set([])
 
 # allele MGI ID from the database mapped to attributes
 # {mgiID:Allele object, ...}
@@ -217,8 +282,8 @@ newStrainDict = {}
 # processing center mapped to lab code from database
 procCtrToLabCodeDict = {}
 
-# list of phenotyping centers in the database
-phenoCtrList = []
+# set of phenotyping centers in the database
+phenoCtrSet = set([])
 
 # Expected MGI ID to strain info mapping from configuration
 strainInfoMapping = os.environ['STRAIN_INFO']
@@ -239,7 +304,7 @@ strainTypeDict = {}
 strainAttribDict = {}
 
 # uniq set of strain lines written to strainload input file
-strainLineList = []
+strainLineSet = set([])
 
 # convenience object for allele information 
 #
@@ -253,6 +318,229 @@ class Allele:
         self.m = markerID
         self.c = mutantIDs
 
+# intermediate row: one per parsed json doc; the fields are kept as a
+# tuple and only joined into a tab-delimited line when written to a file
+#
+class IMPCRow(collections.namedtuple('IMPCRow', 
+        'resourceName phenotypingCenter interpretationCenter productionCtr '
+        'mutantID mpID alleleID alleleState alleleSymbol inputStrain '
+        'markerID gender colonyID')):
+    __slots__ = ()
+
+    def __str__(self):
+        return TAB.join(self) + CRT
+
+# htmp row: one per line of the HTMP Load format file
+#
+class HTMPRow(collections.namedtuple('HTMPRow', 
+        'phenotypingCenter interpretationCenter mutantID mpID alleleID '
+        'alleleState alleleSymbol markerID evidenceCode strainName gender '
+        'colonyID resourceName')):
+    __slots__ = ()
+
+    def __str__(self):
+        return TAB.join(self) + CRT
+
+# convenience object for reading the docs array of a json file
+# one doc at a time; only the current doc and one buffered chunk
+# of the file are held in memory
+#
+class JSONDocStream:
+    def __init__(self, fp,	# file - json input file
+            path):		# list - keys leading to the docs array
+        self.fp = fp
+        self.path = path
+        self.buf = ''
+        self.pos = 0
+        self.eof = 0
+
+    # read the next chunk, dropping what has already been consumed
+    def fill(self):
+        chunk = self.fp.read(jsonChunkSize)
+        if not chunk:
+            self.eof = 1
+            return 0
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return 1
+
+    # skip white space, return the next char or '' at end of file
+    def peek(self):
+        while 1:
+            self.pos = jsonWhiteSpace.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, c):
+        if self.peek() != c:
+            raise ValueError('Expected "%s" in json file: %s' % (c, self.fp.name))
+        self.pos += 1
+
+    # decode the next value, reading more of the file until it is complete
+    def decode(self):
+        self.peek()
+        while 1:
+            try:
+                value, end = jsonDecoder.raw_decode(self.buf, self.pos)
+                # a number at the end of the buffer, or followed by a
+                # partial fraction/exponent, may be cut off
+                if self.eof or (end < len(self.buf) and \
+                        not (isinstance(value, (int, float)) and \
+                            self.buf[end] in jsonNumberChars)):
+                    self.pos = end
+                    return value
+            except ValueError:
+                if self.eof:
+                    raise
+            self.fill()
+
+    # skip the rest of the current object/array without decoding it
+    def skip(self):
+        depth = 1
+        while 1:
+            m = jsonStructure.search(self.buf, self.pos)
+            if not m:
+                self.pos = len(self.buf)
+                if not self.fill():
+                    raise ValueError('Unexpected end of json file: %s' % self.fp.name)
+                continue
+            self.pos = m.start()
+            c = m.group()
+            if c == '"':
+                m = jsonString.match(self.buf, self.pos)
+                if not m:
+                    # string continues in the next chunk
+                    if not self.fill():
+                        raise ValueError('Unexpected end of json file: %s' % self.fp.name)
+                    continue
+                self.pos = m.end()
+                continue
+            self.pos += 1
+            if c in '{[':
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return
+
+    # decode the next doc one key at a time
+    # returns None if rejectDoc(key, value) returns 1 for any key; the
+    # rest of the doc is skipped
+    def decodeDoc(self, rejectDoc):
+        self.expect('{')
+        doc = {}
+        while 1:
+            c = self.peek()
+            if c == '}':
+                self.pos += 1
+                return doc
+            if c == ',':
+                self.pos += 1
+                continue
+            key = self.decode()
+            self.expect(':')
+            value = self.decode()
+            if rejectDoc(key, value):
+                self.skip()
+                return None
+            doc[key] = value
+
+    # position the stream at the value of 'key' in the current object
+    def seekKey(self, key):
+        while 1:
+            c = self.peek()
+            if c == ',':
+                self.pos += 1
+                continue
+            if c != '"':
+                raise ValueError('Key "%s" not found in json file: %s' % (key, self.fp.name))
+            name = self.decode()
+            self.expect(':')
+            if name == key:
+                return
+            self.decode()
+
+    # generator - yields each doc in the docs array
+    #	rejectDoc - optional function(key, value), see decodeDoc
+    def docs(self, rejectDoc=None):
+        self.expect('{')
+        for i in range(len(self.path)):
+            self.seekKey(self.path[i])
+            if i < len(self.path) - 1:
+                self.expect('{')
+        self.expect('[')
+        while 1:
+            c = self.peek()
+            if c == ']':
+                return
+            if c == ',':
+                self.pos += 1
+                continue
+            if rejectDoc is None:
+                yield self.decode()
+                continue
+            doc = self.decodeDoc(rejectDoc)
+            if doc is not None:
+                yield doc
+
+# convenience object for removing duplicate intermediate rows (IMPCRow)
+# distinct rows are kept in memory until there are dedupMaxLines of
+# them, then sorted and spilled to a run file next to the intermediate
+# file; the runs are merged when parsing is done
+#
+class RowDedup:
+    def __init__(self, fpDup):	# file - duplicate rows, or None
+        self.fpDup = fpDup
+        self.rowSet = set([])
+        self.runFiles = []
+
+    def add(self, row):
+        if row in self.rowSet:
+            if self.fpDup:
+                self.fpDup.write(str(row))
+            return
+        self.rowSet.add(row)
+        if dedupMaxLines and len(self.rowSet) >= dedupMaxLines:
+            self.spill()
+
+    def spill(self):
+        runFile = '%s_run%s' % (inputFileInt, len(self.runFiles) + 1)
+        fp = open(runFile, 'w')
+        for row in sorted(self.rowSet):
+            fp.write(str(row))
+        fp.close()
+        self.runFiles.append(runFile)
+        self.rowSet = set([])
+
+    # generator - yields the distinct rows in sorted order
+    # duplicates found across run files are written to the dup file
+    def rows(self):
+        if not self.runFiles:
+            for row in sorted(self.rowSet):
+                yield row
+            self.rowSet = set([])
+            return
+
+        self.spill()
+        fpRuns = [open(runFile, 'r') for runFile in self.runFiles]
+        runs = [readIntRows(fp) for fp in fpRuns]
+        prevRow = None
+        for row in heapq.merge(*runs):
+            if row == prevRow:
+                if self.fpDup:
+                    self.fpDup.write(str(row))
+                continue
+            prevRow = row
+            yield row
+
+        for fp in fpRuns:
+            fp.close()
+        for runFile in self.runFiles:
+            os.remove(runFile)
+        self.runFiles = []
+
 #
 # Purpose: Initialization  of variable with values from the environment
 #	load lookup structures from the database
@@ -264,10 +552,12 @@ class Allele:
 def initialize():
     global inputFile, inputFileInt, inputFileDup, gentarFile, htmpFile
     global strainFile, logDiagFile, logCurFile, htmpErrorFile, htmpSkipFile
-    global allelesInDbDict, mclInDbDict, procCtrToLabCodeDict, phenoCtrList
+    global allelesInDbDict, mclInDbDict, procCtrToLabCodeDict, phenoCtrSet
     global strainInfoDict, referenceStrainDict, strainTemplateDict, strainTypeDict
     global colonyToStrainNameDict, strainNameToColonyIdDict, strainNameToGentypeDict
-    global privateStrainList, isIMPC, isLacZ, loadType
+    global privateStrainSet, isIMPC, isLacZ, loadType, jsonStream
+    global dedupMaxLines, pipeline, keepIntFile, sortedOutput
+    global validateWorkers, validateChunkSize, snapshotFile, lookupWorkers
 
     inputFile = os.getenv('SOURCE_COPY_INPUT_FILE')
     inputFileInt = '%s_int' % inputFile
@@ -280,6 +570,15 @@ def initialize():
     htmpSkipFile = os.getenv('HTMPSKIP_INPUT_FILE')
     loadType = os.getenv('LOADTYPE')
     #print 'loadType: %s' % loadType
+    jsonStream = os.getenv('PREPROCESS_JSON_STREAM') == '1'
+    dedupMaxLines = int(os.getenv('PREPROCESS_DEDUP_MAX_LINES', '0'))
+    pipeline = os.getenv('PREPROCESS_PIPELINE') == '1'
+    keepIntFile = os.getenv('PREPROCESS_KEEP_INT') == '1'
+    sortedOutput = os.getenv('PREPROCESS_SORTED_OUTPUT') == '1'
+    validateWorkers = int(os.getenv('PREPROCESS_WORKERS', '1'))
+    validateChunkSize = int(os.getenv('PREPROCESS_WORKER_CHUNK', '1000'))
+    snapshotFile = os.getenv('PREPROCESS_SNAPSHOT_FILE')
+    lookupWorkers = int(os.getenv('PREPROCESS_DB_WORKERS', '1'))
     rc = 0
 
     #
@@ -317,6 +616,57 @@ def initialize():
         print('Environment variable not set: HTMPSKIP_INPUT_FILE')
         rc = 1
 
+    # load strain mappings from config
+    # original:
+    # tokens = map(string.strip, string.split(strainInfoMapping, ','))
+
+    # after 2to3, does not work in script, works in inter interp
+    # tokens = list(map(str.strip, str.split(strainInfoMapping, ',')))
+
+    # this does not work in the script, but works in the inter interp
+    #tokens = list(map(str.strip, strainInfoMapping.split(',')))
+    # for the hell of it:
+    #tokens = list(map(str.strip(), strainInfoMapping.split(',')))
+
+    # this works too with list comprehension
+    #tokens = [x.strip() for x in strainInfoMapping.split(',')]
+    tokens = list(map(lambda str : str.strip(), strainInfoMapping.split(',')))
+    for t in tokens:
+        #iStrain, rID, rStrain, rTemplate, rType, rAttr = str.split(t, '|')
+        iStrain, rID, rStrain, rTemplate, rType, rAttr = t.split('|')
+        inputStrainList.append(iStrain)
+        referenceStrainDict[iStrain] = rStrain
+        strainTemplateDict[iStrain] = rTemplate
+        strainTypeDict[iStrain]  = rType
+        strainAttribDict[iStrain] = rAttr
+
+    db.useOneConnection(1)
+
+    # reuse the lookup snapshot if the database has not changed since
+    # it was saved
+    probe = None
+    if snapshotFile:
+        probe = getSnapshotProbe()
+        if probe is None:
+            print('Lookup snapshot not used, table statistics are not available')
+    if probe is None or loadSnapshot(probe) != 0:
+        loadLookups()
+        if probe is not None:
+            saveSnapshot(probe)
+
+    db.useOneConnection(0)
+
+    return rc
+
+#
+# Purpose: query alleles with mutant cell lines
+# Returns: list of result rows
+# Assumes: Nothing
+# Effects: queries the database
+# Throws: Nothing
+#
+def queryAllelesWithMCL():
+
     #
     # Allele Status where _vocab_key = 37
     # In Progress (847111)
@@ -326,8 +676,6 @@ def initialize():
     # preferred MGI IDs
     #
 
-    db.useOneConnection(1)
-
     #
     # start: alleles with mutant cell lines
     #	Targeted (847116)
@@ -365,29 +713,20 @@ def initialize():
 #	and a1._MGIType_key = 28
 #	and a1.preferred = 1
 #	''', 'auto')
-    results = db.sql('''
+    return db.sql('''
         select distinct a.*, c.cellLine as mclID
         from all_withmcl a, ALL_Allele_CellLine ac, ALL_CellLine c
         where a._Allele_key = ac._Allele_key
         and ac._MutantCellLine_key = c._CellLine_key''', 'auto')
-        
-    for r in results:
-        a = r['alleleMgiID']
-        s = r['aSymbol']
-        m = r['markerMgiID']
-        c = r['mclID']
-        if a in allelesInDbDict:
-            allelesInDbDict[a].c.append(c)
-        else:
-            allelesInDbDict[a] = Allele(a, s, m, [c])
-        if c not in mclInDbDict:
-            mclInDbDict[c] = []
-        mclInDbDict[c].append(s)
 
-    # end: alleles with mutant cell lines
-   
-    # start: alleles without mutant cell lines
-    #
+#
+# Purpose: query alleles without mutant cell lines
+# Returns: list of result rows
+# Assumes: Nothing
+# Effects: queries the database
+# Throws: Nothing
+#
+def queryAllelesNoMCL():
 
     db.sql('''select distinct a1.accid as alleleMgiID, a2.accid as markerMgiID, 
             ll.symbol as aSymbol, ll._Allele_key
@@ -408,8 +747,161 @@ def initialize():
 
     db.sql('create index idx_endo on all_nomcl(_Allele_key)', None)
 
-    results = db.sql('select distinct * from all_nomcl', 'auto')
-    for r in results:
+    return db.sql('select distinct * from all_nomcl', 'auto')
+
+#
+# Purpose: query production center/labcode mapping
+# Returns: list of result rows
+# Assumes: Nothing
+# Effects: queries the database
+# Throws: Nothing
+#
+def queryProcCtrs():
+    return db.sql('select term, abbreviation from VOC_Term where _Vocab_key = 98', 'auto')
+
+#
+# Purpose: query phenotyping centers
+# Returns: list of result rows
+# Assumes: Nothing
+# Effects: queries the database
+# Throws: Nothing
+#
+def queryPhenoCtrs():
+    return db.sql('select term from VOC_Term where _Vocab_key = 99', 'auto')
+
+#
+# Purpose: query colony code to strain ID mappings
+#	strain types 'coisogenic' and 'Not Specified'
+#	strain  may not contain a colony id/will be reported later
+# Returns: list of result rows
+# Assumes: Nothing
+# Effects: queries the database
+# Throws: Nothing
+#
+def queryColonyNotes():
+
+    # remove private strain constraint
+    return db.sql('''
+        select s.strain, trim(n.note) as colonyID
+        from PRB_Strain s, MGI_Note n
+        where s._StrainType_key in (3410530, 3410535, 6508969) 
+        and s._Strain_key = n._Object_key
+        and n._NoteType_key = 1012
+        and n._MGIType_key = 10
+        ''', 'auto')
+
+#
+# Purpose: query strain name to genotype mappings
+# Returns: list of result rows
+# Assumes: Nothing
+# Effects: queries the database
+# Throws: Nothing
+#
+def queryStrainGenotypes():
+
+    # remove private strain constraint
+    return db.sql('''select distinct s.strain, cl.cellLine, a.accid  as alleleID
+        from PRB_Strain s, GXD_Genotype g, GXD_AllelePair ap, ALL_CellLine cl, ACC_Accession a
+        where s._Strain_key != -1
+        and s.standard = 1
+        and g._Strain_key = s._Strain_key
+        and g._Genotype_key = ap._Genotype_key
+        and ap._MutantCellline_key_1 is not null
+        and ap._MutantCellline_key_1 = cl._CellLine_key
+        and ap._Allele_key_1 = a._Object_key
+        and a._MGIType_key = 11
+        and a._LogicalDB_key = 1
+        and a.preferred = 1
+        and a.prefixPart = 'MGI:' ''', 'auto')
+
+#
+# Purpose: query private strains
+# Returns: list of result rows
+# Assumes: Nothing
+# Effects: queries the database
+# Throws: Nothing
+#
+def queryPrivateStrains():
+    return db.sql('''select strain
+            from PRB_Strain
+            where private = 1''', 'auto')
+
+# the independent lookup queries, in the order they are assembled
+lookupQueries = [queryAllelesWithMCL, queryAllelesNoMCL, queryProcCtrs, 
+    queryPhenoCtrs, queryColonyNotes, queryStrainGenotypes, queryPrivateStrains]
+
+#
+# Purpose: worker process - run one lookup query on its own connection
+# Returns: list of result rows
+# Assumes: Nothing
+# Effects: opens/closes a database connection
+# Throws: Nothing
+#
+def runLookupQuery(i):
+    db.useOneConnection(1)
+    results = lookupQueries[i]()
+    db.useOneConnection(0)
+    return results
+
+#
+# Purpose: run the lookup queries, at the same time on a pool of
+#	lookupWorkers connections when configured
+# Returns: list of results, one per query in lookupQueries
+# Assumes: database connection is open
+# Effects: queries the database; in pool mode the shared connection
+#	is closed while the workers run and then re-opened
+# Throws: Nothing
+#
+def runLookupQueries():
+
+    if lookupWorkers <= 1:
+        return [query() for query in lookupQueries]
+
+    # the workers must not inherit the open connection
+    db.useOneConnection(0)
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    pool = multiprocessing.Pool(min(lookupWorkers, len(lookupQueries)))
+    resultsList = pool.map(runLookupQuery, range(len(lookupQueries)), 1)
+    pool.close()
+    pool.join()
+
+    db.useOneConnection(1)
+
+    return resultsList
+
+#
+# Purpose: load the lookup structures from the database
+# Returns: 0
+# Assumes: database connection is open
+# Effects: queries the database
+# Throws: Nothing
+#
+def loadLookups():
+
+    withMCLResults, noMCLResults, procCtrResults, phenoCtrResults, \
+        colonyResults, genotypeResults, privateResults = runLookupQueries()
+
+    for r in withMCLResults:
+        a = r['alleleMgiID']
+        s = r['aSymbol']
+        m = r['markerMgiID']
+        c = r['mclID']
+        if a in allelesInDbDict:
+            allelesInDbDict[a].c.append(c)
+        else:
+            allelesInDbDict[a] = Allele(a, s, m, [c])
+        if c not in mclInDbDict:
+            mclInDbDict[c] = []
+        mclInDbDict[c].append(s)
+
+    # end: alleles with mutant cell lines
+   
+    # start: alleles without mutant cell lines
+    #
+
+    for r in noMCLResults:
         a = r['alleleMgiID']
         s = r['aSymbol']
         m = r['markerMgiID']
@@ -422,57 +914,16 @@ def initialize():
     # end: alleles without mutant cell lines
 
     # load production center/labcode mapping 
-    results = db.sql('select term, abbreviation from VOC_Term where _Vocab_key = 98', 'auto')
     print('loading procCtrToLabCodeDict')
-    for r in results:
+    for r in procCtrResults:
         print('term: %s abbrev: %s' % (r['term'], r['abbreviation']))
         procCtrToLabCodeDict[r['term']] = r['abbreviation']
 
     # load list of phenotyping centers in the database
-    results = db.sql('select term from VOC_Term where _Vocab_key = 99', 'auto')
-    for r in results:
-        phenoCtrList.append(r['term'])
+    for r in phenoCtrResults:
+        phenoCtrSet.add(r['term'])
 
-    # load strain mappings from config
-    # original:
-    # tokens = map(string.strip, string.split(strainInfoMapping, ','))
-
-    # after 2to3, does not work in script, works in inter interp
-    # tokens = list(map(str.strip, str.split(strainInfoMapping, ',')))
-
-    # this does not work in the script, but works in the inter interp
-    #tokens = list(map(str.strip, strainInfoMapping.split(',')))
-    # for the hell of it:
-    #tokens = list(map(str.strip(), strainInfoMapping.split(',')))
-
-    # this works too with list comprehension
-    #tokens = [x.strip() for x in strainInfoMapping.split(',')]
-    tokens = list(map(lambda str : str.strip(), strainInfoMapping.split(',')))
-    for t in tokens:
-        #iStrain, rID, rStrain, rTemplate, rType, rAttr = str.split(t, '|')
-        iStrain, rID, rStrain, rTemplate, rType, rAttr = t.split('|')
-        inputStrainList.append(iStrain)
-        referenceStrainDict[iStrain] = rStrain
-        strainTemplateDict[iStrain] = rTemplate
-        strainTypeDict[iStrain]  = rType
-        strainAttribDict[iStrain] = rAttr
-
-    #
-    # load colony code to strain ID mappings
-    # strain types 'coisogenic' and 'Not Specified'
-    # strain  may not contain a colony id/will be reported later
-    #
-    # remove private strain constraint
-    results = db.sql('''
-        select s.strain, trim(n.note) as colonyID
-        from PRB_Strain s, MGI_Note n
-        where s._StrainType_key in (3410530, 3410535, 6508969) 
-        and s._Strain_key = n._Object_key
-        and n._NoteType_key = 1012
-        and n._MGIType_key = 10
-        ''', 'auto')
-
-    for r in results:
+    for r in colonyResults:
         # HIPPO US146
         # colony ids can be a pipe delimited str.e.g. 'BL3751|BL3751_TCP'
         cIDs =  r['colonyID'].strip()
@@ -487,28 +938,13 @@ def initialize():
             colonyToStrainNameDict[cID].append(strain)
         # 5/2017 multi strain check addition: 4c1b2
         if strain in strainNameToColonyIdDict:
-            multiStrainNameList.append(strain)
+            multiStrainNameSet.add(strain)
         else:
             # HIPPO 6/2016 - handle multi colonyIDs/strain
             strainNameToColonyIdDict[strain] = cIDList
 
     # load strain name to genotype mappings
-    # remove private strain constraint
-    results = db.sql('''select distinct s.strain, cl.cellLine, a.accid  as alleleID
-        from PRB_Strain s, GXD_Genotype g, GXD_AllelePair ap, ALL_CellLine cl, ACC_Accession a
-        where s._Strain_key != -1
-        and s.standard = 1
-        and g._Strain_key = s._Strain_key
-        and g._Genotype_key = ap._Genotype_key
-        and ap._MutantCellline_key_1 is not null
-        and ap._MutantCellline_key_1 = cl._CellLine_key
-        and ap._Allele_key_1 = a._Object_key
-        and a._MGIType_key = 11
-        and a._LogicalDB_key = 1
-        and a.preferred = 1
-        and a.prefixPart = 'MGI:' ''', 'auto')
-
-    for r in results:
+    for r in genotypeResults:
         # Check 4c1a
         s = r['strain']
         c = r['cellLine']
@@ -517,15 +953,143 @@ def initialize():
             strainNameToGenotypeDict[s] = []
         strainNameToGenotypeDict[s].append([a, c])
 
-    results = db.sql('''select strain
-            from PRB_Strain
-            where private = 1''', 'auto')
+    for r in privateResults:
+        privateStrainSet.add(r['strain'])
+
+    return 0
+
+#
+# Purpose: get the freshness probe for the lookup snapshot, for the
+#	tables the lookups are built from:
+#	- the insert/update/delete counters from pg_stat_user_tables; they
+#	  also change for updates in place (ex. ACC_Accession.preferred,
+#	  ALL_Allele._Marker_key), and reading them does not scan the tables
+#	- the live row estimate, relfilenode and row count estimate, which
+#	  change when a table is reloaded (ex. a dump/restore refresh)
+#	- the time the database statistics were last reset
+#	A change to any row of a table, not only the rows the lookups use,
+#	makes the snapshot out of date.
+# Returns: list of str; None if the counters cannot be trusted
+#	(track_counts is off, a table is not visible, or a table has
+#	all-zero counters, as after a statistics reset), in which case the
+#	snapshot must not be used
+# Assumes: database connection is open
+# Effects: queries the database
+# Throws: Nothing
+#
+def getSnapshotProbe():
+
+    tableList = ['acc_accession', 'all_allele', 'all_allele_cellline',
+        'all_cellline', 'gxd_allelepair', 'gxd_genotype', 'mgi_note',
+        'prb_strain', 'voc_term']
+
+    results = db.sql('''
+        select current_setting('track_counts') as trackCounts,
+            pg_stat_get_db_stat_reset_time(d.oid) as resetTime
+        from pg_database d
+        where d.datname = current_database()
+        ''', 'auto')
+
+    if results[0]['trackCounts'] != 'on':
+        return None
+
+    probe = ['stats reset %s' % (results[0]['resetTime'])]
+
+    results = db.sql('''
+        select s.schemaname, s.relname, s.n_tup_ins, s.n_tup_upd, s.n_tup_del,
+            s.n_live_tup, c.relfilenode, c.reltuples
+        from pg_stat_user_tables s, pg_class c
+        where s.relid = c.oid
+        and s.relname in ('%s')
+        order by s.schemaname, s.relname
+        ''' % ("', '".join(tableList)), 'auto')
+
+    if sorted([r['relname'] for r in results]) != tableList:
+        return None
+
     for r in results:
-        privateStrainList.append(r['strain'])
+        if r['n_tup_ins'] + r['n_tup_upd'] + r['n_tup_del'] == 0:
+            return None
+        probe.append('%s.%s %s %s %s %s %s %s' % (r['schemaname'], r['relname'], \
+            r['n_tup_ins'], r['n_tup_upd'], r['n_tup_del'], \
+            r['n_live_tup'], r['relfilenode'], r['reltuples']))
 
-    db.useOneConnection(0)
+    return probe
 
-    return rc
+#
+# Purpose: load the lookup structures from the snapshot file
+# Returns: 1 if there is no snapshot, it cannot be read (ex. it was
+#	saved by an older version), or it was saved with a different
+#	probe, else 0
+# Assumes: Nothing
+# Effects: reads the snapshot file
+# Throws: Nothing
+#
+def loadSnapshot(probe):
+
+    try:
+        fp = open(snapshotFile, 'rb')
+        snapshot = pickle.load(fp)
+        fp.close()
+        snapshotProbe = snapshot.get('probe')
+        lookupList = [
+            (allelesInDbDict, snapshot['allelesInDbDict']),
+            (mclInDbDict, snapshot['mclInDbDict']),
+            (procCtrToLabCodeDict, snapshot['procCtrToLabCodeDict']),
+            (phenoCtrSet, snapshot['phenoCtrSet']),
+            (colonyToStrainNameDict, snapshot['colonyToStrainNameDict']),
+            (strainNameToColonyIdDict, snapshot['strainNameToColonyIdDict']),
+            (multiStrainNameSet, snapshot['multiStrainNameSet']),
+            (strainNameToGenotypeDict, snapshot['strainNameToGenotypeDict']),
+            (privateStrainSet, snapshot['privateStrainSet']),
+            ]
+    except:
+        print('No usable lookup snapshot: %s' % snapshotFile)
+        return 1
+
+    if snapshotProbe != probe:
+        print('Lookup snapshot is out of date: %s' % snapshotFile)
+        return 1
+
+    print('Using lookup snapshot: %s' % snapshotFile)
+    for lookup, value in lookupList:
+        lookup.update(value)
+
+    return 0
+
+#
+# Purpose: save the lookup structures to the snapshot file
+# Returns: 0
+# Assumes: lookups have been loaded
+# Effects: writes the snapshot file
+# Throws: Nothing
+#
+def saveSnapshot(probe):
+
+    snapshot = {
+        'probe' : probe,
+        'allelesInDbDict' : allelesInDbDict,
+        'mclInDbDict' : mclInDbDict,
+        'procCtrToLabCodeDict' : procCtrToLabCodeDict,
+        'phenoCtrSet' : phenoCtrSet,
+        'colonyToStrainNameDict' : colonyToStrainNameDict,
+        'strainNameToColonyIdDict' : strainNameToColonyIdDict,
+        'multiStrainNameSet' : multiStrainNameSet,
+        'strainNameToGenotypeDict' : strainNameToGenotypeDict,
+        'privateStrainSet' : privateStrainSet,
+        }
+
+    # write to a temp file first so a failed run never leaves a partial
+    # snapshot behind
+    try:
+        fp = open(snapshotFile + '.tmp', 'wb')
+        pickle.dump(snapshot, fp, pickle.HIGHEST_PROTOCOL)
+        fp.close()
+        os.rename(snapshotFile + '.tmp', snapshotFile)
+    except:
+        print('Cannot write lookup snapshot: %s' % snapshotFile)
+
+    return 0
 
 #
 # Purpose: Open input/output files.
@@ -552,11 +1116,12 @@ def openFiles():
     #
     # Open the intermediate file
     #
-    try:
-        fpInputintWrite = open(inputFileInt, 'w')
-    except:
-        print('Cannot open file: ' + inputFileInt)
-        return 1
+    if not pipeline or keepIntFile:
+        try:
+            fpInputintWrite = open(inputFileInt, 'w')
+        except:
+            print('Cannot open file: ' + inputFileInt)
+            return 1
 
     #
     # Open the intermediate Dup file
@@ -649,6 +1214,9 @@ def closeFiles():
     if fpInput:
         fpInput.close()
 
+    if fpInputdup:
+        fpInputdup.close()
+
     if fpGENTAR:
         fpGENTAR.close()
 
@@ -676,7 +1244,8 @@ def closeFiles():
 # Purpose: Log a message to the diagnostic log, optionally
 #	write a line to the error file. Write to error Dict
 #	which is used to sort errors and will be written to 
-#	curation log later
+#	curation log later. In a worker process the message is
+#	saved to deferredLogList for the parent instead.
 # Returns: 0
 # Assumes: file descriptors exist
 # Effects: Nothing
@@ -684,16 +1253,91 @@ def closeFiles():
 #
 def logIt(msg, line, isError, typeError):
     global errorDict
+
+    if deferredLogList is not None:
+        deferredLogList.append((msg, line, isError, typeError))
+        return 0
+
     logit = errorDisplay % (msg, line)
     fpLogDiag.write(logit)
     if not typeError in errorDict:
         errorDict[typeError] = []
     errorDict[typeError].append(logit)
     if isError:
-        fpHTMPError.write(line)
+        fpHTMPError.write(str(line))
 
     return 0
 
+#
+# Purpose: get the shared copy of a parsed field value
+# Returns: value
+# Assumes: Nothing
+# Effects: adds new values to fieldValueDict
+# Throws: Nothing
+#
+def internValue(value):
+    return fieldValueDict.setdefault(value, value)
+
+#
+# Purpose: create an intermediate row using the shared copy of each field
+# Returns: IMPCRow
+# Assumes: Nothing
+# Effects: adds new values to fieldValueDict
+# Throws: Nothing
+#
+def internRow(fields):
+    return IMPCRow._make([fieldValueDict.setdefault(v, v) for v in fields])
+
+#
+# Purpose: generator - yields the rows of an intermediate format file
+# Returns: IMPCRow per line
+# Assumes: file descriptor has been created
+# Effects: Nothing
+# Throws: Nothing
+#
+def readIntRows(fp):
+    for line in fp:
+        yield internRow(line[:-1].split(TAB))
+
+#
+# Purpose: generator - passes the distinct parsed rows on to the 
+#	validation stage while writing them to the intermediate file
+# Returns: IMPCRow per row
+# Assumes: fpInputintWrite exists
+# Effects: writes intermediate file to file system
+# Throws: Nothing
+#
+def teeIntFile(rows):
+    for row in rows:
+        fpInputintWrite.write(str(row))
+        yield row
+    fpInputintWrite.close()
+
+#
+# Purpose: hand the distinct parsed rows to createHTMPFile; unless in
+#	pipeline mode they are written to the intermediate file and read
+#	back by createHTMPFile
+# Returns: number of rows written to the intermediate file
+# Assumes: Nothing
+# Effects: writes intermediate file to file system
+# Throws: Nothing
+#
+def saveParsedRows(rowDedup):
+    global parsedRows
+
+    parsedRows = rowDedup.rows()
+    if pipeline:
+        if keepIntFile:
+            parsedRows = teeIntFile(parsedRows)
+        return 0
+
+    rcdWrittenCt = 0
+    for row in teeIntFile(parsedRows):
+        rcdWrittenCt += 1
+    parsedRows = None
+
+    return rcdWrittenCt
+
 #
 # Purpose: parse GENTAR report (tab-delimited) file into a data structure
 # Returns: 0
@@ -706,7 +1350,7 @@ def parseGENTARFile():
 
     print('Parsing GENTAR, creating lookup: %s'  % time.strftime("%H.%M.%S.%m.%d.%y", time.localtime(time.time())))
 
-    for line in fpGENTAR.readlines():
+    for line in fpGENTAR:
 
         tokens = line[:-1].split('\t')
 
@@ -720,7 +1364,8 @@ def parseGENTARFile():
                                   # found while testing py 2to3
 
         # map the colony id to productionCtr, mutantID and markerID
-        value = '%s|%s|%s' % (productionCtr, mutantID, markerID)
+        # the values are shared by every row with this colony id
+        value = (internValue(productionCtr), internValue(mutantID), internValue(markerID))
 
         # if we find a dup, just print for now to see what we get 
         if colonyID in colonyToMCLDict and colonyToMCLDict[colonyID] == value:
@@ -731,6 +1376,23 @@ def parseGENTARFile():
 
     return 0
 
+#
+# Purpose: get the json docs from the input file, either streamed one
+#	at a time or from the whole file loaded with json.load
+#	rejectDoc - optional function(key, value); when streaming, a doc 
+#	is dropped as soon as it returns 1, see JSONDocStream.decodeDoc
+# Returns: iterable of docs (dict)
+# Assumes: json file descriptor has been created
+# Effects: Nothing
+# Throws: ValueError if the file is not valid json
+#
+def getJSONDocs(rejectDoc=None):
+
+    if jsonStream:
+        return JSONDocStream(fpInput, ['response', 'docs']).docs(rejectDoc)
+
+    return json.load(fpInput)['response']['docs']
+
 #
 # Purpose: parse IMPC/MP json file into intermediate file
 #	lines with missing data reported to the skip file
@@ -743,13 +1405,13 @@ def parseGENTARFile():
 def parseIMPCFile():
     global fpInputintWrite, fpInputdup
     
-    jFile = json.load(fpInput)
-
     # the data interpretation center property value for IMPC
     interpretationCenter = 'IMPC'
-    lineSet = set([])
 
-    for f in jFile['response']['docs']:
+    # assures dups are filtered out
+    rowDedup = RowDedup(fpInputdup)
+
+    for f in getJSONDocs():
 
         try:
             resourceName = f['resource_name']
@@ -800,22 +1462,12 @@ def parseIMPCFile():
         except:
             colonyID = ''
 
-        # line representing data from the IMPC input file 
+        # row representing data from the IMPC input file 
         # no productionCenter
         # no mutant ID
-        line = resourceName + '\t' + \
-             phenotypingCenter + '\t' + \
-             interpretationCenter + '\t' + \
-             '\t' + \
-             '\t' + \
-             mpID + '\t' + \
-             alleleID + '\t' + \
-             alleleState + '\t' + \
-             alleleSymbol + '\t' + \
-             inputStrain + '\t' + \
-             markerID + '\t' + \
-             gender + '\t' + \
-             colonyID + '\n'
+        row = internRow((resourceName, phenotypingCenter, interpretationCenter, 
+            '', '', mpID, alleleID, alleleState, alleleSymbol, 
+            inputStrain, markerID, gender, colonyID))
 
         # skip if blank field in IMPC data and report to the skip file
         if resourceName == '' or \
@@ -828,21 +1480,12 @@ def parseIMPCFile():
                 markerID == '' or  \
                 gender == '' or \
                 colonyID == '':
-            fpHTMPSkip.write(line)
+            fpHTMPSkip.write(str(row))
             continue
 
-        # lineSet assures dups are filtered out
-        if line in lineSet:
-            fpInputdup.write(line)
-            continue
-
-        lineSet.add(line)
-
-    for line in lineSet:
-        fpInputintWrite.write(line)
+        rowDedup.add(row)
 
-    fpInputintWrite.close()
-    fpInputdup.close()
+    saveParsedRows(rowDedup)
 
     return 0
 
@@ -856,17 +1499,28 @@ def parseIMPCLacZFile():
     global fpInputintWrite, fpIMCPdup
 
     print('Parsing IMPC/LacZ input file: %s' % time.strftime("%H.%M.%S.%m.%d.%y", time.localtime(time.time())))
-    jFile = json.load(fpInput)
     resourceName = 'IMPC' 
     interpretationCenter = 'IMPC' 
-    lineSet = set([])
+    rowDedup = RowDedup(None)
     sGroupValList = []
     totalCt = 0
     notExpCt = 0
     nopasId = 0
-    rcdWrittenCt = 0
 
-    for f in jFile['response']['docs']:
+    # when streaming, control group docs are dropped as soon as
+    # biological_sample_group is read, before the rest is decoded
+    def rejectDoc(key, value):
+        nonlocal totalCt, notExpCt
+
+        if key != 'biological_sample_group' or value.lower() == 'experimental':
+            return 0
+        if value not in sGroupValList:
+            sGroupValList.append(value)
+        totalCt += 1
+        notExpCt += 1
+        return 1
+
+    for f in getJSONDocs(rejectDoc):
 
         totalCt += 1
         sGroup = f['biological_sample_group']
@@ -908,23 +1562,13 @@ def parseIMPCLacZFile():
         except:
             parameter_association_value = []
 
-        # line representing data from the IMPC LacZ input file
+        # row representing data from the IMPC LacZ input file
         # no productionCenter
         # no mutant ID
         # no MP ID
-        line =  resourceName + '\t' + \
-             phenotypingCenter + '\t' + \
-             interpretationCenter + '\t' + \
-             '\t' + \
-             '\t' + \
-             '\t' + \
-             alleleID + '\t' + \
-             alleleState + '\t' + \
-             alleleSymbol + '\t' + \
-             inputStrain + '\t' + \
-             markerID + '\t' + \
-             gender + '\t' + \
-             colonyID + '\n'
+        row = internRow((resourceName, phenotypingCenter, interpretationCenter, 
+            '', '', '', alleleID, alleleState, alleleSymbol, 
+            inputStrain, markerID, gender, colonyID))
 
         # skip if blank field in IMPC data and report to the skip file
         if phenotypingCenter == '' or \
@@ -935,22 +1579,18 @@ def parseIMPCLacZFile():
                 markerID == '' or  \
                 gender == '' or \
                 colonyID == '':
-            fpHTMPSkip.write(line)
+            fpHTMPSkip.write(str(row))
             continue
 
-        lineSet.add(line)
+        rowDedup.add(row)
 
-    for line in lineSet:
-        fpInputintWrite.write(line)
-        rcdWrittenCt += 1
-
-    fpInputintWrite.close()
-    fpInputdup.close()
+    rcdWrittenCt = saveParsedRows(rowDedup)
 
     print('notExpCt: %s' % notExpCt)
     print('nopasId: %s' % nopasId)
     print('non experimental values: %s' % sGroupValList)
-    print('total records written: %s' % rcdWrittenCt)
+    if not pipeline:
+        print('total records written: %s' % rcdWrittenCt)
     print('totalCt: %s' % totalCt)
 
     return 0
@@ -992,7 +1632,7 @@ def checkGenotype(strainName, inputAlleleID, inputMutantID, line, uniqStrainProc
 # Throws: Nothing
 #
 def checkPrivateStrain(strainName, line, uniqStrainProcessingKey, caller):
-    if strainName in privateStrainList:
+    if strainName in privateStrainSet:
         if caller  == 'uniqStrainProcessing':
             msg = 'Strain name match to private strain in database: %s ' % (strainName)
             uniqStrainProcessingDict[uniqStrainProcessingKey] = [msg, line]
@@ -1015,16 +1655,16 @@ def doUniqStrainChecks(uniqStrainProcessingKey, line):
     
     dupStrainKey = 0
 
-    if uniqStrainProcessingKey in list(uniqStrainProcessingDict.keys()):
+    if uniqStrainProcessingKey in uniqStrainProcessingDict:
         uniqStrainProcessingDict[uniqStrainProcessingKey].append(line)
         dupStrainKey = 1
 
     # unpack the key into attributes
     inputAlleleID, alleleSymbol, inputStrain, markerID, colonyID, inputMutantID, prodCtr = \
-        str.split(uniqStrainProcessingKey, '|') 
+        uniqStrainProcessingKey
     # Production Center Lab Code Check US5 doc 4c2
     print('doUniqStrainChecks prodCtr: %s' % prodCtr)
-    if not prodCtr in list(procCtrToLabCodeDict.keys()):
+    if not prodCtr in procCtrToLabCodeDict:
         if dupStrainKey == 0:
             msg = 'Production Center not in MGI (voc_term table): %s' % prodCtr
             logIt(msg, line, 1, 'prodCtrNotInDb')
@@ -1058,7 +1698,7 @@ def doUniqStrainChecks(uniqStrainProcessingKey, line):
         return 'Not Specified'
 
     # 4c1b2 Strain name match to multiple strains
-    if strainName in multiStrainNameList:
+    if strainName in multiStrainNameSet:
         msg = 'Multiple strain objects in MGI for strain %s' % strainName
         uniqStrainProcessingDict[uniqStrainProcessingKey] = [msg, line]
 
@@ -1100,8 +1740,7 @@ def doUniqStrainChecks(uniqStrainProcessingKey, line):
         colonyID + '\t' + \
         attributes + '\n'
 
-    if strainLine not in strainLineList:
-        strainLineList.append(strainLine)
+    strainLineSet.add(strainLine)
 
     # save all the new strains with their strain lines for later checking
     # and writing to bcp file
@@ -1201,7 +1840,7 @@ def checkGender(gender, line):
 #
 def checkPhenoCtr(phenoCtr, line):
 
-    if phenoCtr not in phenoCtrList:
+    if phenoCtr not in phenoCtrSet:
         msg = 'Unrecognized phenotyping center %s' % phenoCtr
         logIt(msg, line, 1, 'phenoCtr')
         return 'error'
@@ -1228,6 +1867,167 @@ def compareMarkers(markerID, gentarMrkID, line):
 
     return 0
 #
+# Purpose: do the checks on an intermediate row that only read the 
+#	lookups: allele state, gender, phenotyping center, GENTAR colony 
+#	ID/marker and allele/MCL consistency
+# Returns: None if the row has an error, else the row with alleleState,
+#	gender, productionCtr and mutantID resolved
+# Assumes: lookups have been loaded
+# Effects: writes to error file and curation/diagnostic logs (see logIt)
+# Throws: Nothing
+#
+def validateRow(row):
+    error = 0
+
+    # the row is only serialized if it is written to a log/error file
+    line = row
+
+    # IMPC - mutantID and productionCtr blank
+    # Lacz - mutantID, productionCtr and mpID blank
+    resourceName, phenotypingCenter, interpretationCenter, productionCtr, \
+        mutantID, mpID, alleleID, alleleState, alleleSymbol, inputStrain, \
+        markerID, gender, colonyID = row
+
+    returnVal = checkAlleleState(alleleState, line)
+    if returnVal == 'error':
+        error = 1
+    else: alleleState = returnVal
+
+    gender= checkGender(gender, line)
+    
+    returnVal= checkPhenoCtr(phenotypingCenter, line)
+    if returnVal == 'error':
+        error = 1
+
+    # if alleleState or phenotyping error, skip the row
+    if error:
+        return None
+    #
+    # IMPC/LacZ only 
+    #
+    if isIMPC or isLacZ:
+        # verify the IMPC/colony_id with the GENTAR/colonyName
+        if checkColonyID(colonyID, line):
+            return None
+
+        # verify the IMPC/markerID with the GENTAR/marker ID
+        # note that the GENTAR file also provides the 'mutantID' (es cell line)
+        productionCtr, mutantID, gentarMrkID = colonyToMCLDict[colonyID]
+
+        if compareMarkers(markerID, gentarMrkID, line):
+            return None
+
+    # Allele/MCL Object Identity/Consistency Check US5 doc 4b
+
+    if alleleID in allelesInDbDict: # 4b2a
+
+        dbAllele = allelesInDbDict[alleleID]
+
+        # report this but don't exclude it
+        if alleleSymbol != dbAllele.s:
+            msg = 'Allele Symbol: %s does not match MGI symbol: %s' % (alleleSymbol, dbAllele.s)
+            logIt(msg, line, 1, 'alleleNotMatch')
+            error = 1
+
+        if markerID != dbAllele.m:
+            msg = 'Marker ID: %s does not match MGI marker ID: %s' % (markerID, dbAllele.m)
+            logIt(msg, line, 1, 'markerNotMatch')
+            error = 1
+
+        # If input row has MCL, but that MCL is associated with a 
+        # only a different allele in MGI than specified in the input file, 
+        # report and skip
+        if mutantID != '' and mutantID not in dbAllele.c and mutantID in mclInDbDict:
+            dbAlleleList = mclInDbDict[mutantID]
+            if alleleSymbol not in dbAlleleList:
+                msg = 'Mutant ID: %s is associated with different allele(s) in the database. Incoming allele: %s, DB Allele(s) %s' % (mutantID, alleleSymbol, ', '.join(dbAlleleList))
+                logIt(msg, line, 1, 'mclDiffAllele')
+                error = 1
+        # If input row has MCL, but that MCL is not associated with 
+        # the allele in MGI - report as non-fatal error, load data 
+        # using null MCL for genotype
+        elif mutantID != '' and mutantID not in dbAllele.c:
+            msg = ' Mutant ID: %s is not associated with %s in MGI loading data with null-MCL' % (mutantID, alleleID)
+            logIt(msg, line, 1, 'mutIdNotAssoc')
+            mutantID = ''
+
+    else: # US5 doc 4b2
+        # 15 cases in impc.json e.g. NULL-114475FCF4
+        msg = 'Allele not in MGI: %s' % alleleID
+        logIt(msg, line, 1, 'alleleNotInDb')
+        error = 1
+
+    if error == 1:
+        return None
+
+    return row._replace(alleleState=alleleState, gender=gender, 
+        productionCtr=productionCtr, mutantID=mutantID)
+
+#
+# Purpose: worker process - validate a chunk of rows, saving the log
+#	messages so the parent can write them in input order
+# Returns: list of (row, validateRow result, logIt arguments)
+# Assumes: lookups were loaded before the worker was forked
+# Effects: Nothing
+# Throws: Nothing
+#
+def validateRowChunk(rowChunk):
+    global deferredLogList
+
+    results = []
+    for row in rowChunk:
+        deferredLogList = []
+        results.append((row, validateRow(row), deferredLogList))
+    deferredLogList = None
+
+    return results
+
+#
+# Purpose: generator - yields lists of validateChunkSize rows
+# Returns: list of rows
+# Assumes: Nothing
+# Effects: Nothing
+# Throws: Nothing
+#
+def chunkRows(rows):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == validateChunkSize:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+#
+# Purpose: generator - validate the rows, sharded across validateWorkers
+#	processes when configured. The workers share the lookups read-only
+#	(fork); results come back in input order so the strain processing
+#	that follows is the same as a serial run
+# Returns: (row, validateRow result, logIt arguments still to be written)
+# Assumes: lookups have been loaded
+# Effects: Nothing
+# Throws: Nothing
+#
+def validateRows(rows):
+
+    if validateWorkers <= 1:
+        for row in rows:
+            yield (row, validateRow(row), [])
+        return
+
+    # so the workers do not write out a copy of buffered output
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    pool = multiprocessing.Pool(validateWorkers)
+    for results in pool.imap(validateRowChunk, chunkRows(rows)):
+        for result in results:
+            yield result
+    pool.close()
+    pool.join()
+
+#
 # Purpose: write all errors in errorDict to curation log
 # Returns: Nothing
 # Assumes: Nothing
@@ -1265,112 +2065,50 @@ def createHTMPFile():
     htmpLineDict = {}
 
     # annotations that should be filtered out i.e not written to the htmp file
-    noLoadAnnotList = []
+    noLoadAnnotSet = set([])
 
     #
-    # Open the intermediate file
+    # in pipeline mode the parsed rows come straight from the parser,
+    # otherwise open the intermediate file
     #
-    try:
-        fpInputintRead = open(inputFileInt, 'r')
-    except:
-        print('Cannot open file: ' + inputFileInt)
-        return 1
+    if pipeline:
+        rows = parsedRows
+    else:
+        try:
+            fpInputintRead = open(inputFileInt, 'r')
+        except:
+            print('Cannot open file: ' + inputFileInt)
+            return 1
+        rows = readIntRows(fpInputintRead)
 
     # 
-    # Parse the intermediate file where 1) dups are removed 2) lines w/missing 
+    # Parse the intermediate rows where 1) dups are removed 2) lines w/missing 
     #    data skipped
     #
     
-    for line in fpInputintRead.readlines():
-        error = 0
+    for row, validRow, logList in validateRows(rows):
 
-        # IMPC - mutantID and productionCtr blank
-        # Lacz - mutantID, productionCtr and mpID blank
-        resourceName, phenotypingCenter, interpretationCenter, productionCtr, \
-            mutantID, mpID, alleleID, alleleState, alleleSymbol, inputStrain, \
-            markerID, gender, colonyID = line[:-1].split('\t')
+        # write the worker's log messages in input order
+        for logArgs in logList:
+            logIt(*logArgs)
 
-        returnVal = checkAlleleState(alleleState, line)
-        if returnVal == 'error':
-            error = 1
-        else: alleleState = returnVal
-
-        gender= checkGender(gender, line)
-        
-        returnVal= checkPhenoCtr(phenotypingCenter, line)
-        if returnVal == 'error':
-            error = 1
-
-        # if alleleState or phenotyping error, continue to next line
-        if error:
+        if validRow is None:
             continue
-        #
-        # IMPC/LacZ only 
-        #
-        if isIMPC or isLacZ:
-            # verify the IMPC/colony_id with the GENTAR/colonyName
-            if checkColonyID(colonyID, line):
-                continue
-
-            # verify the IMPC/markerID with the GENTAR/marker ID
-            # note that the GENTAR file also provides the 'mutantID' (es cell line)
-            productionCtr, mutantID, gentarMrkID = str.split(colonyToMCLDict[colonyID], '|')
-            print('productionCtr: %s from colonyToMCLDict[colonyID]' % (productionCtr))
-
-            if compareMarkers(markerID, gentarMrkID, line):
-                continue
-
-        # Allele/MCL Object Identity/Consistency Check US5 doc 4b
-
-        if alleleID in allelesInDbDict: # 4b2a
 
-            dbAllele = allelesInDbDict[alleleID]
+        # the row is only serialized if it is written to a log/error file
+        line = row
 
-            # report this but don't exclude it
-            if alleleSymbol != dbAllele.s:
-                msg = 'Allele Symbol: %s does not match MGI symbol: %s' % (alleleSymbol, dbAllele.s)
-                logIt(msg, line, 1, 'alleleNotMatch')
-                error = 1
-
-            if markerID != dbAllele.m:
-                msg = 'Marker ID: %s does not match MGI marker ID: %s' % (markerID, dbAllele.m)
-                logIt(msg, line, 1, 'markerNotMatch')
-                error = 1
-
-            # If input row has MCL, but that MCL is associated with a 
-            # only a different allele in MGI than specified in the input file, 
-            # report and skip
-            if mutantID != '' and mutantID not in dbAllele.c and mutantID in mclInDbDict:
-                dbAlleleList = mclInDbDict[mutantID]
-                if alleleSymbol not in dbAlleleList:
-                    msg = 'Mutant ID: %s is associated with different allele(s) in the database. Incoming allele: %s, DB Allele(s) %s' % (mutantID, alleleSymbol, ', '.join(dbAlleleList))
-                    logIt(msg, line, 1, 'mclDiffAllele')
-                    error = 1
-            # If input row has MCL, but that MCL is not associated with 
-            # the allele in MGI - report as non-fatal error, load data 
-            # using null MCL for genotype
-            elif mutantID != '' and mutantID not in dbAllele.c:
-                msg = ' Mutant ID: %s is not associated with %s in MGI loading data with null-MCL' % (mutantID, alleleID)
-                logIt(msg, line, 1, 'mutIdNotAssoc')
-                mutantID = ''
-
-        else: # US5 doc 4b2
-            # 15 cases in impc.json e.g. NULL-114475FCF4
-            msg = 'Allele not in MGI: %s' % alleleID
-            logIt(msg, line, 1, 'alleleNotInDb')
-            error = 1
-
-        if error == 1:
-            continue
+        resourceName, phenotypingCenter, interpretationCenter, productionCtr, \
+            mutantID, mpID, alleleID, alleleState, alleleSymbol, inputStrain, \
+            markerID, gender, colonyID = validRow
 
         #
         # Now do checks on the uniq strains in the input file
         #
 
         # key to determine uniq entries for strain processing
-        uniqStrainProcessingKey = '%s|%s|%s|%s|%s|%s|%s' % \
-            (alleleID, alleleSymbol, inputStrain, markerID, \
-                colonyID, mutantID, productionCtr)
+        uniqStrainProcessingKey = (alleleID, alleleSymbol, inputStrain, \
+            markerID, colonyID, mutantID, productionCtr)
         #print('uniqStrainPrcessingKey: %s' % uniqStrainProcessingKey)
         # resolve the colonyID to a strain in the database
         if colonyID in colonyToStrainNameDict:
@@ -1421,14 +2159,18 @@ def createHTMPFile():
         #     gender + '\t' + \
         #     colonyID + '\t' + \
         #     resourceName + '\n'
-        htmpLine = '%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s' % (phenotypingCenter, TAB, interpretationCenter, TAB, mutantID, TAB, mpID, TAB, alleleID, TAB, alleleState, TAB, alleleSymbol, TAB, markerID, TAB, evidenceCode, TAB, strainName, TAB, gender, TAB, colonyID, TAB, resourceName, CRT)
-        #fpHTMP.write(htmpLine)
-
-        # save the lines to a data structure with 'strain|colonyID' key
+        # strain names built from a template are a new str for every row
+        strainName = internValue(strainName)
+        htmpLine = HTMPRow(phenotypingCenter, interpretationCenter, mutantID, 
+            mpID, alleleID, alleleState, alleleSymbol, markerID, evidenceCode, 
+            strainName, gender, colonyID, resourceName)
+        #fpHTMP.write(str(htmpLine))
+
+        # save the lines to a data structure with (strain, colonyID) key
         # later we look for multiple colony IDs per strain and annotations
         # to load for just ONE colony ID. We DO NOT want to load annotations
         # for the rejected colony ID(s), we just want to report them
-        key = '%s|%s' % (strainName, colonyID)
+        key = (strainName, colonyID)
         if key not in htmpLineDict:
             htmpLineDict[key] = []
         htmpLineDict[key].append(htmpLine)
@@ -1458,8 +2200,8 @@ def createHTMPFile():
             for line in list(multiSet):
                 cID = str.split(line, '\t')[7]
                 # this corresponds to the key in htmpLineDict
-                key = '%s|%s' % (s, cID)
-                noLoadAnnotList.append(key)
+                key = (s, cID)
+                noLoadAnnotSet.add(key)
 
             # get a arbitrary line from the list, the strain will be loaded with
             # this colony ID
@@ -1481,16 +2223,25 @@ def createHTMPFile():
             fpStrain.write('%s%s' % (list(newStrainDict[s])[0], '\n'))
 
     # write lines to the htmp file checking the noloadAnnotList first
-    #print 'noLoadAnnotList: %s' % noLoadAnnotList
+    #print 'noLoadAnnotSet: %s' % noLoadAnnotSet
+    htmpLineList = []
     for key in htmpLineDict:
         #print 'htmpLineDict key: "%s"' % key
         #print 'htmpLineDict lines: "%s"' % htmpLineDict[key]
-        if key in noLoadAnnotList:
-            #print 'key "%s" in noLoadAnnotList' % key
+        if key in noLoadAnnotSet:
+            #print 'key "%s" in noLoadAnnotSet' % key
             continue
         #print 'adding line to HTMP file'
-        for line in htmpLineDict[key]:
-            fpHTMP.write(line)
+        htmpLineList.extend(htmpLineDict[key])
+
+    # same order as: LC_ALL=C sort -t"\t" -k7,7 -k6,6 -k4,4 (whole line
+    # breaks ties), as htmpload.sh sorts it; makeGenotype checks the order
+    if sortedOutput:
+        htmpLineList.sort(key=lambda line: (line.alleleSymbol, 
+            line.alleleState, line.mpID, str(line)))
+
+    for line in htmpLineList:
+        fpHTMP.write(str(line))
 
     # write errors to curation log
     print('writing to curator log')
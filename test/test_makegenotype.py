@@ -0,0 +1,211 @@
+#
+# test_makegenotype.py
+#
+# Tests getGenotypes() in bin/makeGenotype.py on a synthetic HTMP file:
+# the genotype uniqueness key, and that the time stays linear in the
+# number of rows.
+#
+# makeGenotype.py runs as soon as it is imported, so only its settings and
+# functions are taken from its source; the lookups that it reads from the
+# database (prefetchKeys, initialize) are filled in directly.
+#
+# Usage:
+#	python3 -m pytest test/test_makegenotype.py
+#
+
+import ast
+import gc
+import io
+import os
+import shutil
+import subprocess
+import time
+import unittest
+
+makeGenotypeFile = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    '..', 'bin', 'makeGenotype.py')
+
+# modules that need the MGI libraries or a database connection
+dbModuleList = ['db', 'loadlib', 'sourceloadlib', 'alleleloadlib', 'preparelib', 'Set']
+
+# number of rows in the smaller timing run
+rowCount = 20000
+
+# the 4N/N time ratio is 4 if linear, 16 if quadratic
+maxRatio = 10
+
+#
+# Purpose: load the settings and functions from makeGenotype.py, without
+#	the database modules or the main section
+# Returns: dictionary (namespace)
+#
+def loadMakeGenotype():
+
+    tree = ast.parse(open(makeGenotypeFile).read())
+    body = []
+
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            if node.names[0].name not in dbModuleList:
+                body.append(node)
+        elif isinstance(node, ast.Assign):
+            names = [n.id for n in ast.walk(node.value) if isinstance(n, ast.Name)]
+            if not set(names) & set(dbModuleList):
+                body.append(node)
+        elif isinstance(node, (ast.FunctionDef, ast.ClassDef)):
+            body.append(node)
+
+    namespace = {}
+    exec(compile(ast.Module(body=body, type_ignores=[]), makeGenotypeFile, 'exec'), namespace)
+
+    return namespace
+
+#
+# Purpose: an HTMP file line
+# Returns: str.
+#
+def htmpLine(mutantID, mpID, alleleID, alleleState, alleleSymbol, markerID,
+        strainName='Not Specified', gender='Male', colonyID=''):
+
+    return '\t'.join(['JAX', 'JAX', mutantID, mpID, alleleID, alleleState,
+        alleleSymbol, markerID, 'EXP', strainName, gender, colonyID, 'IMPC']) + '\n'
+
+#
+# Purpose: set up makeGenotype to read the lines, with the lookups for
+#	the markers/alleles given
+# Returns: namespace
+#
+def setUpGenotypes(lineList, markerKeyDict, alleleKeyDict):
+
+    ns = loadMakeGenotype()
+
+    ns['fpHTMPInput'] = io.StringIO(''.join(lineList))
+    for fp in ['fpLogDiag', 'fpLogCur', 'fpHTMPDup', 'fpHTMPError', 'fpHTMP', 'fpGenotype']:
+        ns[fp] = io.StringIO()
+
+    ns['createdBy'] = 'htmpload'
+    ns['markerKeyDict'].update(markerKeyDict)
+    ns['alleleKeyDict'].update(alleleKeyDict)
+    ns['strainIndexDict'][('Not Specified', None)] = ('MGI:2159747', -1)
+
+    return ns
+
+#
+# Purpose: set up makeGenotype with count synthetic rows: one
+#	homozygous genotype per allele, 2 MP IDs per allele and
+#	2 genders per MP ID, in the order of the sorted HTMP file
+# Returns: namespace
+#
+def setUpRows(count):
+
+    lineList = []
+    markerKeyDict = {}
+    alleleKeyDict = {}
+
+    for i in range(count // 4):
+        alleleID = 'MGI:%d' % (1000000 + i)
+        markerID = 'MGI:%d' % (5000000 + i)
+        alleleKeyDict[alleleID] = 1000000 + i
+        markerKeyDict[markerID] = 5000000 + i
+        for mpID in ['MP:0001', 'MP:0002']:
+            for gender in ['Female', 'Male']:
+                lineList.append(htmpLine('', mpID, alleleID, 'Homozygous',
+                    'Gene%07d<tm1>' % (i), markerID, gender=gender))
+
+    return setUpGenotypes(lineList, markerKeyDict, alleleKeyDict)
+
+#
+# Purpose: time getGenotypes over count synthetic rows (best of 3 runs)
+# Returns: seconds
+#
+def timeGetGenotypes(count):
+
+    best = None
+    for run in range(3):
+        ns = setUpRows(count)
+        gc.disable()
+        start = time.perf_counter()
+        ns['getGenotypes']()
+        elapsed = time.perf_counter() - start
+        gc.enable()
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best
+
+class GetGenotypesTest(unittest.TestCase):
+
+    # marker 1/allele 23 and marker 12/allele 3 were the same key
+    # when the keys were concatenated into a string ('123...')
+    def testGenotypeKeyNoCollision(self):
+        lineList = [
+            htmpLine('', 'MP:0001', 'MGI:23', 'Homozygous', 'A<tm1>', 'MGI:1'),
+            htmpLine('', 'MP:0001', 'MGI:3', 'Homozygous', 'B<tm1>', 'MGI:12'),
+            ]
+        ns = setUpGenotypes(lineList, {'MGI:1' : 1, 'MGI:12' : 12},
+            {'MGI:23' : 23, 'MGI:3' : 3})
+
+        self.assertEqual(ns['getGenotypes'](), 0)
+        self.assertEqual(ns['genotypeOrderDict'], {
+            (1, 23, 'Homozygous', -1, 'null') : 1,
+            (12, 3, 'Homozygous', -1, 'null') : 2,
+            })
+        self.assertEqual(len(ns['fpGenotype'].getvalue().splitlines()), 2)
+        self.assertEqual(ns['fpHTMPDup'].getvalue(), '')
+
+    def testGetGenotypes(self):
+        ns = setUpRows(8)
+
+        self.assertEqual(ns['getGenotypes'](), 0)
+        self.assertEqual(len(ns['genotypeOrderDict']), 2)
+        self.assertEqual(len(ns['fpGenotype'].getvalue().splitlines()), 2)
+        # one annotation per genotype/MP ID; Female + Male = Both
+        annotList = ns['fpHTMP'].getvalue().splitlines()
+        self.assertEqual(len(annotList), 4)
+        self.assertEqual([a.split('\t')[11] for a in annotList], ['Both'] * 4)
+
+    # a block that sorts before the last one means the file is not sorted
+    def testUnsortedFile(self):
+        lineList = [
+            htmpLine('', 'MP:0001', 'MGI:23', 'Homozygous', 'B<tm1>', 'MGI:1'),
+            htmpLine('', 'MP:0001', 'MGI:3', 'Homozygous', 'A<tm1>', 'MGI:12'),
+            ]
+        ns = setUpGenotypes(lineList, {'MGI:1' : 1, 'MGI:12' : 12},
+            {'MGI:23' : 23, 'MGI:3' : 3})
+
+        self.assertEqual(ns['getGenotypes'](), 1)
+        self.assertIn('input file is not sorted', ns['fpLogCur'].getvalue())
+
+    # the order of the shell sort in htmpload.sh is the order getGenotypes
+    # checks for: symbols with mixed case, punctuation and non-ascii
+    @unittest.skipIf(shutil.which('sort') is None, 'no sort command')
+    def testShellSortOrder(self):
+        symbolList = ['a<tm1>', 'B<tm1>', 'Gene-1<tm1>', 'Gene1<tm1>', 
+            'Gene_1<tm1>', 'Gen\u00e9<tm1>', 'gene<tm1>', 'Z<tm1>']
+        lineList = []
+        markerKeyDict = {}
+        alleleKeyDict = {}
+        for i, symbol in enumerate(symbolList):
+            alleleKeyDict['MGI:%d' % (100 + i)] = 100 + i
+            markerKeyDict['MGI:%d' % (500 + i)] = 500 + i
+            for mpID in ['MP:0002', 'MP:0001']:
+                for alleleState in ['Homozygous', 'Hemizygous']:
+                    lineList.append(htmpLine('', mpID, 'MGI:%d' % (100 + i), 
+                        alleleState, symbol, 'MGI:%d' % (500 + i)))
+
+        sortedText = subprocess.run(['sort', '-t', '\t', '-k7,7', '-k6,6', '-k4,4'],
+            input=''.join(reversed(lineList)).encode('utf-8'), stdout=subprocess.PIPE,
+            env=dict(os.environ, LC_ALL='C'), check=True).stdout.decode('utf-8')
+
+        ns = setUpGenotypes([sortedText], markerKeyDict, alleleKeyDict)
+        for i in range(len(symbolList)):
+            ns['chromosomeDict'][500 + i] = 'X'
+        self.assertEqual(ns['getGenotypes'](), 0)
+        self.assertNotIn('input file is not sorted', ns['fpLogCur'].getvalue())
+
+    def testGetGenotypesLinear(self):
+        ratio = timeGetGenotypes(4 * rowCount) / timeGetGenotypes(rowCount)
+        self.assertLess(ratio, maxRatio)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+#
+# test_preprocess_json.py
+#
+# Tests the streaming json reader in bin/preprocess.py (JSONDocStream)
+# against json.loads, with the input split into small chunks so that
+# values are cut off at every offset.
+#
+# preprocess.py runs as soon as it is imported, so only the json settings
+# and JSONDocStream are taken from its source.
+#
+# Usage:
+#	python3 -m pytest test/test_preprocess_json.py
+#
+
+import ast
+import io
+import json
+import os
+import unittest
+
+preprocessFile = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    '..', 'bin', 'preprocess.py')
+
+# sample docs: floats with fractions and exponents, negative numbers,
+# strings with escaped quotes, nested objects
+sampleDocs = [
+    {'w': 12.5, 'x': -3.25e+10, 'y': 1E-5, 'z': 7, 'v': 0.125,
+        'biological_sample_group': 'experimental'},
+    {'w': -0.5, 'name': 'a "quoted" \\ name', 'n': {'e': 6.02e23, 'l': [1.5, 2]},
+        'biological_sample_group': 'control'},
+    {'w': 123456.789, 'x': 1e-7, 'biological_sample_group': 'experimental'},
+]
+
+sampleText = json.dumps({'response': {'docs': sampleDocs}})
+
+#
+# Purpose: load the json settings and JSONDocStream from preprocess.py
+# Returns: dictionary (namespace) with jsonChunkSize, JSONDocStream, etc.
+#
+def loadJSONDocStream():
+
+    tree = ast.parse(open(preprocessFile).read())
+    body = []
+
+    for node in tree.body:
+        if isinstance(node, ast.Import) and \
+                node.names[0].name in ('json', 're'):
+            body.append(node)
+        elif isinstance(node, ast.Assign) and \
+                isinstance(node.targets[0], ast.Name) and \
+                node.targets[0].id.startswith('json'):
+            body.append(node)
+        elif isinstance(node, ast.ClassDef) and node.name == 'JSONDocStream':
+            body.append(node)
+
+    namespace = {}
+    exec(compile(ast.Module(body=body, type_ignores=[]), preprocessFile, 'exec'), namespace)
+    return namespace
+
+# file object that returns the text in the given pieces, one per read
+class PieceReader:
+    def __init__(self, pieceList):
+        self.pieceList = list(pieceList)
+        self.name = 'test.json'
+
+    def read(self, size):
+        if self.pieceList:
+            return self.pieceList.pop(0)
+        return ''
+
+# rejects the control docs, like parseIMPCLacZFile
+def rejectControl(key, value):
+    return key == 'biological_sample_group' and value == 'control'
+
+class JSONDocStreamTest(unittest.TestCase):
+
+    def setUp(self):
+        self.ns = loadJSONDocStream()
+
+    def readDocs(self, fp, chunkSize, rejectDoc=None):
+        self.ns['jsonChunkSize'] = chunkSize
+        stream = self.ns['JSONDocStream'](fp, ['response', 'docs'])
+        return list(stream.docs(rejectDoc))
+
+    def testSmallChunks(self):
+        for chunkSize in range(1, 80):
+            fp = io.StringIO(sampleText)
+            self.assertEqual(self.readDocs(fp, chunkSize), sampleDocs, chunkSize)
+
+    def testSmallChunksRejectDoc(self):
+        expected = [d for d in sampleDocs if d['biological_sample_group'] != 'control']
+        for chunkSize in range(1, 80):
+            fp = io.StringIO(sampleText)
+            self.assertEqual(self.readDocs(fp, chunkSize, rejectControl), expected, chunkSize)
+
+    # one split at every offset, with a chunk size larger than the file
+    def testSplitAtEveryOffset(self):
+        expected = [d for d in sampleDocs if d['biological_sample_group'] != 'control']
+        for i in range(1, len(sampleText)):
+            pieces = [sampleText[:i], sampleText[i:]]
+            self.assertEqual(self.readDocs(PieceReader(pieces), 1048576), sampleDocs, i)
+            self.assertEqual(self.readDocs(PieceReader(pieces), 1048576, rejectControl), expected, i)
+
+    # floats cut off just after the '.', 'e', 'E', or exponent sign
+    def testSplitFloats(self):
+        for number in ['12.5', '-3.25e+10', '1E-5', '6.02e23', '0.125']:
+            text = '{"response": {"docs": [{"w": %s, "biological_sample_group": "x"}]}}' % number
+            expected = [{'w': json.loads(number), 'biological_sample_group': 'x'}]
+            start = text.index(number)
+            for i in range(start + 1, start + len(number)):
+                pieces = [text[:i], text[i:]]
+                self.assertEqual(self.readDocs(PieceReader(pieces), 1048576), expected, (number, i))
+                self.assertEqual(self.readDocs(PieceReader(pieces), 1048576, rejectControl), expected, (number, i))
+
+if __name__ == '__main__':
+    unittest.main()
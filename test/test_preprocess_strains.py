@@ -0,0 +1,165 @@
+#
+# test_preprocess_strains.py
+#
+# Checks that the per-key strain checks in bin/preprocess.py
+# (doUniqStrainChecks, checkPrivateStrain) stay linear: the time for
+# 4N unique strain keys, against lookups of 4N strains, should be about
+# 4 times the time for N keys. A list scan in a membership test would
+# make it about 16 times.
+#
+# preprocess.py runs as soon as it is imported, so only its settings and
+# functions are taken from its source; the database lookups are filled
+# in with synthetic strains.
+#
+# Usage:
+#	python3 -m pytest test/test_preprocess_strains.py
+#
+
+import ast
+import gc
+import os
+import time
+import unittest
+
+preprocessFile = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    '..', 'bin', 'preprocess.py')
+
+# number of unique strain keys in the smaller run
+keyCount = 2000
+
+# the 4N/N time ratio is 4 if linear, 16 if quadratic
+maxRatio = 10
+
+# passes over the keys per timing, so a timing is not too short to measure
+passCount = 50
+
+#
+# Purpose: load the settings and functions from preprocess.py, without
+#	the database module, the environment settings or the main section
+# Returns: dictionary (namespace)
+#
+def loadPreprocess():
+
+    tree = ast.parse(open(preprocessFile).read())
+    body = []
+
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            if node.names[0].name not in ('db', 'Set'):
+                body.append(node)
+        elif isinstance(node, ast.Assign):
+            if 'os.environ' not in ast.unparse(node):
+                body.append(node)
+        elif isinstance(node, (ast.FunctionDef, ast.ClassDef)):
+            body.append(node)
+        else:
+            # the main section
+            break
+
+    namespace = {}
+    exec(compile(ast.Module(body=body, type_ignores=[]), preprocessFile, 'exec'), namespace)
+
+    # doUniqStrainChecks prints the production center of every key
+    namespace['print'] = lambda *args, **kwargs: None
+
+    return namespace
+
+#
+# Purpose: load preprocess.py with lookups of count synthetic strains,
+#	as loadLookups/initialize would fill them in
+# Returns: (namespace, list of unique strain processing keys)
+#
+def setUpStrains(count):
+
+    ns = loadPreprocess()
+
+    ns['inputStrainList'].append('C57BL/6N')
+    ns['referenceStrainDict']['C57BL/6N'] = 'C57BL/6N'
+    ns['strainTemplateDict']['C57BL/6N'] = '%s-%s/%s'
+    ns['strainTypeDict']['C57BL/6N'] = 'coisogenic'
+    ns['strainAttribDict']['C57BL/6N'] = 'mutant strain:targeted mutation'
+    ns['procCtrToLabCodeDict']['JAX'] = 'J'
+
+    keyList = []
+    for i in range(count):
+        symbol = 'Gene%d<tm1a(KOMP)Wtsi>' % (i)
+        strainName = 'C57BL/6N-%s/J' % (symbol)
+
+        # every other strain is private in the database
+        if i % 2 == 0:
+            ns['privateStrainSet'].add(strainName)
+
+        # lookup entries that do not match any key
+        ns['multiStrainNameSet'].add('multi%d' % (i))
+        ns['strainNameToColonyIdDict']['other%d' % (i)] = ['colony%d' % (i)]
+        ns['strainNameToGenotypeDict']['other%d' % (i)] = [['MGI:%d' % (i), '']]
+
+        keyList.append(('MGI:%d' % (i), symbol, 'C57BL/6N', 'MGI:9%d' % (i),
+            'colony%d' % (i), '', 'JAX'))
+
+    return ns, keyList
+
+#
+# Purpose: time doUniqStrainChecks over the keys (best of 3 runs)
+# Returns: seconds
+#
+def timeUniqStrainChecks(count):
+
+    best = None
+    for run in range(3):
+        ns, keyList = setUpStrains(count)
+        doUniqStrainChecks = ns['doUniqStrainChecks']
+        gc.disable()
+        start = time.perf_counter()
+        for key in keyList:
+            doUniqStrainChecks(key, key)
+        elapsed = time.perf_counter() - start
+        gc.enable()
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best
+
+#
+# Purpose: time checkPrivateStrain over the strain names, passCount
+#	times (best of 3 runs)
+# Returns: seconds
+#
+def timeCheckPrivateStrain(count):
+
+    best = None
+    for run in range(3):
+        ns, keyList = setUpStrains(count)
+        checkPrivateStrain = ns['checkPrivateStrain']
+        nameList = ['C57BL/6N-%s/J' % (key[1]) for key in keyList]
+        gc.disable()
+        start = time.perf_counter()
+        for i in range(passCount):
+            for key, strainName in zip(keyList, nameList):
+                checkPrivateStrain(strainName, key, key, 'uniqStrainProcessing')
+        elapsed = time.perf_counter() - start
+        gc.enable()
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best
+
+class StrainChecksTest(unittest.TestCase):
+
+    def testUniqStrainChecksResults(self):
+        ns, keyList = setUpStrains(4)
+        results = [ns['doUniqStrainChecks'](key, key) for key in keyList]
+        self.assertEqual(results, ['error', 'C57BL/6N-Gene1<tm1a(KOMP)Wtsi>/J',
+            'error', 'C57BL/6N-Gene3<tm1a(KOMP)Wtsi>/J'])
+        self.assertEqual(len(ns['strainLineSet']), 2)
+
+    def testUniqStrainChecksLinear(self):
+        ratio = timeUniqStrainChecks(4 * keyCount) / timeUniqStrainChecks(keyCount)
+        self.assertLess(ratio, maxRatio)
+
+    def testCheckPrivateStrainLinear(self):
+        ratio = timeCheckPrivateStrain(4 * keyCount) / timeCheckPrivateStrain(keyCount)
+        self.assertLess(ratio, maxRatio)
+
+if __name__ == '__main__':
+    unittest.main()